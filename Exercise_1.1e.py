@@ -1,337 +1,155 @@
-from gurobipy import Model, GRB, quicksum
-import pandas as pd
+from gurobipy import GRB
 import numpy as np
+import os
+import tempfile
+
+from network import load_network
+from event_activity import DEFAULT_PARAMETERS, build_event_activity_network, solution_from_event_times
+from periodic_model import build_periodic_model, extract_solution, full_network, set_mip_start
+from presolve import presolve_network, PresolveInfeasible
+from cycle_model import build_cycle_model
+from modulo_simplex import heuristic_timetable
+from scenario_sweep import scenario_grid, run_sweep
+from timetable_checker import check_timetables, timetable_array, violation_report
+from timetable_output import format_timetable, timetable_frame, timetable_order, write_timetable
+from instrumentation import RunProfile, phase
+from infeasibility import diagnose_network, format_conflicts
+from headways import add_lazy_headways, corridor_headways, lazy_headway_callback, with_headways
+from solution_cache import SolutionCache, instance_key, solver_settings
+from decomposition import decomposed_timetable
+from delay_simulation import compare_timetables, simulate_delays
+from disruption import retimetable
 
 def read_basic_data():
 
-    travel_times = pd.read_excel('a2_part1.xlsx', 'Travel Times')
-
-    return travel_times
-
-
-def build_model(travel_times):
-
-    # Initialize the model
-    model = Model("TrainTimetabling")
-
-    # Define all stations and lines, including directions
-    all_stations = ['Amr', 'Asd', 'Ut', 'Ehv', 'Std', 'Mt', 'Hdr', 'Nm', 'Shl', 'Vl', 'Hrl']
-    lines_stations = {
-        '800': ['Amr', 'Asd', 'Ut', 'Ehv', 'Std', 'Mt'],
-        '3000': ['Hdr', 'Amr', 'Asd', 'Ut', 'Nm'],
-        '3100': ['Shl', 'Ut', 'Nm'],
-        '3500': ['Shl', 'Ut', 'Ehv', 'Vl'],
-        '3900': ['Ehv', 'Std', 'Hrl'],
-    }
-    directions = ['forward', 'backward']  # Define directions
-
-    # Define decision variables for arrivals and departures for each station and line
-    arrivals = {}
-    departures = {}
-    for line, stations in lines_stations.items():
-        # Define departure variables for all stations except the last one
-        for station in stations[:-1]:
-            departures[('Departure', station, line)] = model.addVar(vtype=GRB.INTEGER, name=f"dep_{station}_{line}")
-        # Define arrival variables for all stations except the first one
-        for station in stations[1:]:
-            arrivals[('Arrival', station, line)] = model.addVar(vtype=GRB.INTEGER, name=f"arr_{station}_{line}")
-        # Define departure variables for the return trip for all stations except the first one
-        for station in stations[1:]:
-            departures[('Departure', station, line, 'return')] = model.addVar(vtype=GRB.INTEGER, name=f"dep_{station}_{line}_return")
-        # Define arrival variables for the return trip for all stations except the last one
-        for station in stations[:-1]:
-            arrivals[('Arrival', station, line, 'return')] = model.addVar(vtype=GRB.INTEGER, name=f"arr_{station}_{line}_return")
-
-    # Parameters
-    T = 30  # The timetable cycle time in minutes
-
-    # Create variables for running and dwelling activities
-    running_activities = {}
-    dwelling_activities = {}
-
-    for line, stations in lines_stations.items():
-        # In the forward direction, we go from the first station to the second-to-last
-        for i in range(len(stations) - 1):
-            running_activities[(stations[i], stations[i+1], line, 'forward')] = model.addVar(
-                vtype=GRB.INTEGER, name=f"run_{stations[i]}_{stations[i+1]}_{line}_forward"
-            )
-        # In the backward direction, we go from the last station to the second station
-        for i in range(len(stations) - 1, 0, -1):
-            running_activities[(stations[i], stations[i-1], line, 'backward')] = model.addVar(
-                vtype=GRB.INTEGER, name=f"run_{stations[i]}_{stations[i-1]}_{line}_backward"
-            )
-
-    for line, stations in lines_stations.items():
-        # For the forward direction, exclude the first and last stations
-        for i in range(1, len(stations) - 1):
-            dwelling_activities[(stations[i], line, 'forward')] = model.addVar(
-                vtype=GRB.INTEGER, name=f"dwell_{stations[i]}_{line}_forward"
-            )
-        # For the backward direction, exclude the first and last stations
-        for i in range(len(stations) - 2, 0, -1):
-            dwelling_activities[(stations[i], line, 'backward')] = model.addVar(
-                vtype=GRB.INTEGER, name=f"dwell_{stations[i]}_{line}_backward"
-            )
-
-    # Create variables for p_ij to simulate the modulo operator for periodicity
-    p_ij = {}
-
-    # Loop through each line and direction to create p_ij variables for running and dwelling activities
-    for line, stations in lines_stations.items():
-        # p_ij for running activities in the forward direction
-        for i in range(len(stations) - 1):
-            p_ij[(stations[i], stations[i+1], line, 'forward')] = model.addVar(
-                vtype=GRB.INTEGER, lb=0, name=f"p_run_{stations[i]}_{stations[i+1]}_{line}_forward"
-            )
-        # p_ij for running activities in the backward direction
-        for i in range(len(stations) - 1, 0, -1):
-            p_ij[(stations[i], stations[i-1], line, 'backward')] = model.addVar(
-                vtype=GRB.INTEGER, lb=0, name=f"p_run_{stations[i]}_{stations[i-1]}_{line}_backward"
-            )
-        # p_ij for dwelling activities, excluding the first and last stations
-        for i in range(1, len(stations) - 1):
-            p_ij[(stations[i], line, 'forward')] = model.addVar(
-                vtype=GRB.INTEGER, lb=0, name=f"p_dwell_{stations[i]}_{line}_forward"
-            )
-        for i in range(len(stations) - 2, 0, -1):
-            p_ij[(stations[i], line, 'backward')] = model.addVar(
-                vtype=GRB.INTEGER, lb=0, name=f"p_dwell_{stations[i]}_{line}_backward"
-            )
-
-    headway_vars = {}
-    sync_vars = {}
-    transfer_vars = {}
-
-    # Define headway variables for the specified connections
-    # Forward --> From either Asd or Shl to Ut ; Backward --> From Ut to either Asd or Shl (depends on the line)
-    headway_vars['800', '3500', 'forward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_800_3500_forward")
-    headway_vars['800', '3100', 'forward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_800_3100_forward")
-    headway_vars['3000', '3500', 'forward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3000_3500_forward")
-    headway_vars['3000', '3100', 'forward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3000_3100_forward")
-    headway_vars['800', '3500', 'backward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_800_3500_backward")
-    headway_vars['800', '3100', 'backward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_800_3100_backward")
-    headway_vars['3000', '3500', 'backward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3000_3500_backward")
-    headway_vars['3000', '3100', 'backward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3000_3100_backward")
-
-    # Define synchronization variables for the specified line pairs
-    sync_pairs = [
-        ('800', '3000', 'Amr', 'Asd'),
-        ('800', '3000', 'Asd', 'Ut'),
-        ('3100', '3500', 'Shl', 'Ut'),
-        ('3100', '3000', 'Ut', 'Nm'),
-        ('800', '3500', 'Ut', 'Ehv'),
-        ('800', '3900', 'Ehv', 'Std'),
-    ]
-    for line1, line2, station1, station2 in sync_pairs:
-        sync_vars[(station1, station2, line1, line2, 'forward')] = model.addVar(vtype=GRB.INTEGER,
-                                                                     name="sync_{}_{}_{}_{}".format(station1,
-                                                                                                    station2, line1,
-                                                                                                    line2))
-        sync_vars[(station2, station1, line1, line2,'backward')] = model.addVar(vtype=GRB.INTEGER,
-                                                                     name="sync_{}_{}_{}_{}".format(station2,
-                                                                                                    station1, line1,
-                                                                                                    line2))
-
-    # Define transfer variables for the specified transfers at Ehv station
-    # Forward --> Ut to Hrl ; Backward --> Hrl to Ut
-    transfer_vars['800', '3900', 'forward'] = model.addVar(vtype=GRB.INTEGER, name=f"transfer_800_3900_forward")
-    transfer_vars['3500', '3900', 'forward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3500_3900_forward")
-    transfer_vars['3900', '800', 'backward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3900_800_backward")
-    transfer_vars['3900', '3500', 'backward'] = model.addVar(vtype=GRB.INTEGER, name=f"head_3900_3500_backward")
-
-    transfer_p_vars = {}
-    sync_p_vars = {}
-    headway_p_vars = {}
-
-    # Add p_ij variables for transfers
-    for key in transfer_vars.keys():
-        transfer_p_vars[key] = model.addVar(vtype=GRB.INTEGER, name="p_transfer_{}_{}_{}".format(*key))
-
-    # Add p_ij variables for synchronization
-    for key in sync_vars.keys():
-        sync_p_vars[key] = model.addVar(vtype=GRB.INTEGER, name="p_sync_{}_{}_{}_{}".format(*key))
-
-    # Add p_ij variables for headway
-    for key in headway_vars.keys():
-        headway_p_vars[key] = model.addVar(vtype=GRB.INTEGER, name="p_headway_{}_{}_{}".format(*key))
-
-    # Objective Function: Minimize the total duration of activities
-    model.setObjective(
-        quicksum(running_activities[activity] for activity in running_activities) +
-        quicksum(dwelling_activities[activity] for activity in dwelling_activities) +
-        quicksum(transfer_vars[activity] for activity in transfer_vars) +
-        quicksum(headway_vars[activity] for activity in headway_vars) +
-        quicksum(sync_vars[activity] for activity in sync_vars),
-        GRB.MINIMIZE
-    )
-
-    # Constraints for running and dwelling activities
-    for line, stations in lines_stations.items():
-        for i in range(len(stations)-1):
-            # Constraints for forward direction
-            if ('Arrival', stations[i+1], line) in arrivals and ('Departure', stations[i], line) in departures:
-                model.addConstr(
-                    arrivals[('Arrival', stations[i+1], line)] - departures[('Departure', stations[i], line)] ==
-                    running_activities[(stations[i], stations[i+1], line, 'forward')] -
-                    T * p_ij[(stations[i], stations[i+1], line, 'forward')],
-                    name=f"running_time_{stations[i]}_{stations[i+1]}_{line}_forward"
-                )
-            # Constraints for backward direction
-            if ('Arrival', stations[i], line, 'return') in arrivals and ('Departure', stations[i+1], line, 'return') in departures:
-                model.addConstr(
-                    arrivals[('Arrival', stations[i], line, 'return')] - departures[('Departure', stations[i+1], line, 'return')] ==
-                    running_activities[(stations[i+1], stations[i], line, 'backward')] -
-                    T * p_ij[(stations[i+1], stations[i], line, 'backward')],
-                    name=f"running_time_{stations[i+1]}_{stations[i]}_{line}_backward"
-                )
-        for i in range(1, len(stations)-1):
-            # Constraints for forward direction dwell time
-            model.addConstr(
-                departures[('Departure', stations[i], line)] - arrivals[('Arrival', stations[i], line)] ==
-                dwelling_activities[(stations[i], line, 'forward')] -
-                T * p_ij[(stations[i], line, 'forward')],
-                name=f"dwelling_time_{stations[i]}_{line}_forward"
-            )
-            # Constraints for backward direction dwell time
-            model.addConstr(
-                departures[('Departure', stations[i], line, 'return')] - arrivals[('Arrival', stations[i], line, 'return')] ==
-                dwelling_activities[(stations[i], line, 'backward')] -
-                T * p_ij[(stations[i], line, 'backward')],
-                name=f"dwelling_time_{stations[i]}_{line}_backward"
-            )
-
-    # Time constraints for events (pi variables)
-    for key, var in arrivals.items():
-        model.addConstr(var <= T, name=f"upper_time_bound_arr_{key}")
-        model.addConstr(var >= 0, name=f"lower_time_bound_arr_{key}")
-    for key, var in departures.items():
-        model.addConstr(var <= T, name=f"upper_time_bound_dep_{key}")
-        model.addConstr(var >= 0, name=f"lower_time_bound_dep_{key}")
-
-    # Bounds constraints for running activities (using travel times)
-    for activity, variable in running_activities.items():
-        i, j, line, direction = activity
-        travel_time = travel_times.loc[
-            (travel_times['From'] == i) & (travel_times['To'] == j), 'Travel Time'
-        ].values[0]
-        model.addConstr(variable == travel_time, name=f"running_time_{i}_{j}_{line}_{direction}")
-
-    # Lower and upper bounds constraints for dwelling activities
-    dwell_time_lower = 2
-    dwell_time_upper = 8
-    for activity, variable in dwelling_activities.items():
-        model.addConstr(variable >= dwell_time_lower, name=f"dwell_time_lower_{activity}")
-        model.addConstr(variable <= dwell_time_upper, name=f"dwell_time_upper_{activity}")
-
-    # Constraints for transfer lines
-    #for key, transfer_time in transfer_vars.items():
-    #    line1, line2, direction = key
-
-    #    if direction == 'forward':
-    #        # For transfer from line1 to line2
-    #        model.addConstr(
-    #            departures[('Departure', 'Ehv', line2)] -
-    #            arrivals[('Arrival', 'Ehv', line1)] ==
-    #            transfer_time - T * transfer_p_vars[key],
-    #            name="transfer_{}_{}_{}_time".format(line1, line2, direction)
-    #        )
-    #    else:
-    #        # For transfer from line2 to line1 (note the reversed order for backward transfers)
-    #        model.addConstr(
-    #            departures[('Departure', 'Ehv', line2, 'return')] -
-    #            arrivals[('Arrival', 'Ehv', line1, 'return')] ==
-    #            transfer_time - T * transfer_p_vars[key],
-    #            name="transfer_{}_{}_{}_time".format(line1, line2, direction)
-    #        )
-
-    # Lower and upper bounds constraints for transfer activities
-    #transfer_time_lower = 2
-    #transfer_time_upper = 5
-    #for activity, variable in transfer_vars.items():
-    #    model.addConstr(variable >= transfer_time_lower, name=f"transfer_time_lower_{activity}")
-    #    model.addConstr(variable <= transfer_time_upper, name=f"transfer_time_upper_{activity}")
-
-
-    # Fixed synchronization time (15 minutes)
-    sync_time = 15
-
-    for (station1, station2, line1, line2, direction), sync_var in sync_vars.items():
-        # Assuming synchronization is based on departure times at station1 for both lines
-        if direction == 'forward':
-            model.addConstr(
-                departures[('Departure', station1, line2)] -
-                departures[('Departure', station1, line1)] ==
-                sync_var - T * sync_p_vars[(station1, station2, line1, line2, direction)],
-                name=f"sync_{line1}_{line2}_{station1}_departure"
-            )
+    # Travel times and lines are read once into an indexed network (cached on disk by file hash)
+    network = load_network('a2_part1.xlsx')
+
+    return network
+
+
+def build_model(network, parameters=None, presolve=True, formulation='pesp', verbose=False, profile=None,
+                diagnose=True, headways=None):
+
+    # Build the periodic event-activity network: integer event IDs and activity arrays
+    # (tail, head, lower, upper, weight, type) for running, dwelling, sync and headway activities
+    with phase(profile, 'build'):
+        ean = build_event_activity_network(network, parameters)
+
+    # Minimum headway between every pair of lines on a shared track segment, on top of the headway_pairs:
+    # 'eager' adds them all to the network, 'lazy' only adds those an incumbent violates (pesp only)
+    corridor = None
+    if headways is not None:
+        if headways not in ('eager', 'lazy'):
+            raise ValueError(f"Unknown headway mode {headways!r}, expected 'eager' or 'lazy'")
+        if headways == 'lazy' and formulation != 'pesp':
+            raise ValueError("Lazy headways need the 'pesp' formulation")
+        min_headway = dict(DEFAULT_PARAMETERS, **(parameters or {}))['min_headway_time']
+        corridor = corridor_headways(network, ean, min_headway)
+        if headways == 'eager':
+            ean = with_headways(ean, corridor)
+
+    # Look for cycles whose span windows cannot add up to a multiple of T before Gurobi sees the
+    # model, conflicts are printed in domain terms and the model is not optimized in solve_model
+    conflicts = []
+    if diagnose:
+        with phase(profile, 'diagnose'):
+            conflicts = diagnose_network(ean)
+        if conflicts:
+            print("Timetable constraints conflict:")
+            print(format_conflicts(conflicts))
+            presolve = False  # presolve would stop at the first conflict
+
+    # Contract fixed running and sync activities into event offsets and tighten the remaining p_ij,
+    # the reduced solution is mapped back to the full timetable in solve_model
+    mapping = None
+    if presolve:
+        with phase(profile, 'presolve'):
+            try:
+                ean, mapping = presolve_network(ean)
+            except PresolveInfeasible as error:
+                # Only without the diagnosis, Gurobi then reports the model infeasible in solve_model
+                print(f"Presolve: {error}, building the model without presolve.")
+
+    # 'pesp': one p_ij per activity, created in bulk from the incidence matrix
+    # 'cycle': cycle-periodicity constraints on an integral cycle basis of the network
+    with phase(profile, 'build_model'):
+        if formulation == 'pesp':
+            model = build_periodic_model(ean, postsolve=mapping)
+        elif formulation == 'cycle':
+            model = build_cycle_model(ean, postsolve=mapping)
         else:
-            model.addConstr(
-                departures[('Departure', station1, line2, 'return')] -
-                departures[('Departure', station1, line1, 'return')] ==
-                sync_var - T * sync_p_vars[(station1, station2, line1, line2, direction)],
-                name=f"sync_{line1}_{line2}_{station1}_departure"
-            )
-
-    # Sync constraints
-    for activity, variable in sync_vars.items():
-        model.addConstr(variable == sync_time, name=f"sync_time_{activity}")
-
-
-    # Minimum headway time (3 minutes)
-    min_headway_time = 3
-
-    # Adding headway constraints using predefined variables
-    for key, headway_var in headway_vars.items():
-        line1, line2, direction = key
-        # Forward direction: Considering arrivals at 'Ut'
-        if direction == 'forward':
-            model.addConstr(
-                arrivals[('Arrival', 'Ut', line2)] -
-                arrivals[('Arrival', 'Ut', line1)] ==
-                headway_var - T * headway_p_vars[key],
-                name=f"headway_{line1}_{line2}_forward"
-            )
-        # Backward direction: Considering departures from 'Ut'
-        else:  # direction == 'backward'
-            model.addConstr(
-                departures[('Departure', 'Ut', line2, 'return')] -
-                departures[('Departure', 'Ut', line1, 'return')] ==
-                headway_var - T * headway_p_vars[key],
-                name=f"headway_{line1}_{line2}_backward"
-            )
-
-    # Headway constraints
-    for activity, variable in headway_vars.items():
-        model.addConstr(variable >= min_headway_time, name=f"head_time_{activity}")
-
-    # Set the departure time for the 3500 line at Schiphol to the ninth minute
-    departures[('Departure', 'Shl', '3500')].lb = 9  # Lower bound
-    departures[('Departure', 'Shl', '3500')].ub = 9  # Upper bound
-
-    # Update model to integrate the new constraints
-    model.update()
-
-    print("Constraints:")
-    for constr in model.getConstrs():
-        print(f"{constr.ConstrName}: {constr.sense} {constr.RHS}")
+            raise ValueError(f"Unknown formulation {formulation!r}, expected 'pesp' or 'cycle'")
+
+        if headways == 'lazy':
+            add_lazy_headways(model, corridor)
+
+        # Update model to integrate the new constraints
+        model.update()
+    model._conflicts = conflicts
+
+    if profile is not None:
+        profile.record_model(model, full_network(model), ean if mapping is not None else None)
+
+    # Dumping every constraint is slow on large models, so only on request
+    if verbose:
+        print("Constraints:")
+        for constr in model.getConstrs():
+            print(f"{constr.ConstrName}: {constr.sense} {constr.RHS}")
 
     return model
 
 
 
-def solve_model(model):
-    # Optimize the model
-    model.optimize()
+def solve_model(model, mip_start=None, profile=None):
+    # Optionally start from a known timetable (event times of the full network)
+    if mip_start is not None:
+        set_mip_start(model, mip_start)
+
+    # Known conflicts from build_model make the model infeasible, no need to optimize or compute an IIS
+    if getattr(model, '_conflicts', None):
+        print("Model is infeasible.")
+        model._status = GRB.INFEASIBLE
+        model.close()
+        return None, None
+
+    # Optimize the model, recording incumbent/bound/gap over time when profiling and adding
+    # violated corridor headways in lazy mode
+    callbacks = []
+    if profile is not None:
+        callbacks.append(profile.mip_callback())
+    if getattr(model, '_lazy_headways', None) is not None:
+        callbacks.append(lazy_headway_callback)
+    with phase(profile, 'optimize'):
+        if callbacks:
+            model.optimize(lambda m, where: [callback(m, where) for callback in callbacks])
+        else:
+            model.optimize()
+    if getattr(model, '_lazy_headways', None) is not None:
+        added = model._lazy_headways['added']
+        print(f"Corridor headways added lazily: {added.sum()} of {len(added)}")
 
     # Check the optimization status
     if model.status == GRB.OPTIMAL:
-        # Store solutions in a dictionary if the model is solved optimally
-        solution_dict = {var.varName: var.X for var in model.getVars()}
-        cost = model.objVal
+        with phase(profile, 'extract'):
+            # Store solutions in a dictionary if the model is solved optimally (for the full network)
+            event_times, solution_dict = extract_solution(model)
+            cost = model.objVal
+
+            # Verify the timetable against the full network independently of the solver
+            ean = full_network(model)
+            if not check_timetables(ean, event_times)['feasible']:
+                print("Solver timetable violates the network:")
+                print(violation_report(ean, event_times).to_string(index=False))
     elif model.status == GRB.INFEASIBLE:
         print("Model is infeasible.")
-        model.computeIIS()  # Compute Irreducible Inconsistent Subsystem
-        model.write("model.ilp")  # Write IIS to a file
+        # The cycle diagnosis is much faster than an IIS, only fall back to Gurobi when it finds nothing
+        conflicts = diagnose_network(full_network(model))
+        if conflicts:
+            print(format_conflicts(conflicts))
+        else:
+            model.computeIIS()  # Compute Irreducible Inconsistent Subsystem
+            model.write("model.ilp")  # Write IIS to a file
         solution_dict, cost = None, None
     elif model.status == GRB.UNBOUNDED:
         print("Model is unbounded.")
@@ -340,90 +158,178 @@ def solve_model(model):
         print(f"Optimization was stopped with status {model.status}")
         solution_dict, cost = None, None
 
-    # Close the Gurobi model
+    # Close the Gurobi model, the status stays available for the solution cache
+    model._status = model.status
     model.close()
 
     return solution_dict, cost
 
 
-def get_station_order_key(row):
-    # Define the station order for each line and direction
-    station_order = {
-        ('3000', 'North'): ['Nm', 'Ut', 'Asd', 'Amr', 'Hdr'],
-        ('3000', 'South'): ['Hdr', 'Amr', 'Asd', 'Ut', 'Nm'],
-        ('800', 'North'): ['Mt', 'Std', 'Ehv', 'Ut', 'Asd', 'Amr'],
-        ('800', 'South'): ['Amr', 'Asd', 'Ut', 'Ehv', 'Std', 'Mt'],
-        ('3100', 'North'): ['Nm', 'Ut', 'Shl'],
-        ('3100', 'South'): ['Shl', 'Ut', 'Nm'],
-        ('3500', 'North'): ['Vl', 'Ehv', 'Ut', 'Shl'],
-        ('3500', 'South'): ['Shl', 'Ut', 'Ehv', 'Vl'],
-        ('3900', 'North'): ['Hrl', 'Std', 'Ehv'],
-        ('3900', 'South'): ['Ehv', 'Std', 'Hrl'],
-
-        # Add other lines and directions as needed
-    }
-
-    # Extract the line, direction, and station from the row
-    line = row['Line']
-    direction = row['Direction']
-    station = row['Station']
-
-    # Use the line and direction to find the correct station order
-    if (line, direction) in station_order:
-        return station_order[(line, direction)].index(station)
-    else:
-        # If the line-direction pair is not in the station order, return a default value
-        return float('inf')
-
-def generate_readable_timetable(solution_dict):
-    # Initialize a list to hold the timetable data
-    timetable_data = []
-
-    # Iterate over the solution dictionary to process departure and arrival times
-    for var_name, time in solution_dict.items():
-        parts = var_name.split('_')
-        if parts[0] in {'dep', 'arr'}:
-            event_type = 'Departure' if parts[0] == 'dep' else 'Arrival'
-            station = parts[1]
-            line = parts[2]
-            direction = 'North' if 'return' in parts else 'South'
-            # Append a tuple with the line, direction, station, type, and time
-            timetable_data.append((line, direction, station, event_type, time))
-
-    # Convert the list of tuples into a DataFrame
-    timetable_df = pd.DataFrame(timetable_data, columns=['Line', 'Direction', 'Station', 'Type', 'Time'])
-
-    # Sort the DataFrame for better readability: by Line, Direction, and Station Order
-    timetable_df['StationOrder'] = timetable_df.apply(get_station_order_key, axis=1)
-    timetable_df.sort_values(by=['Line', 'Direction', 'StationOrder', 'Type'], ascending=[True, True, True, True],
-                             inplace=True)
-
-    # Drop the 'StationOrder' column as it's no longer needed
-    timetable_df.drop('StationOrder', axis=1, inplace=True)
-
-    # Reset the index for the sorted DataFrame
-    timetable_df.reset_index(drop=True, inplace=True)
+def solve_cached(network, parameters=None, cache=None, formulation='pesp', presolve=True, headways=None,
+                 profile=None):
+    # build_model + solve_model behind the content-addressed solution cache: a hit returns the
+    # stored timetable right away, a miss on an instance with the same lines (only other
+    # parameters) starts from the most recent cached timetable. Returns (solution_dict, cost, ean).
+    cache = cache if cache is not None else SolutionCache()
+    key, structure = instance_key(network, parameters, solver_settings(formulation, presolve, headways))
+
+    entry = cache.lookup(key)
+    if entry is not None:
+        print(f"Solution cache hit ({entry['status']})")
+        ean = build_event_activity_network(network, parameters)
+        if entry['status'] == 'infeasible':
+            print("Model is infeasible.")
+            return None, None, ean
+        event_times = np.array([entry['event_times'][name] for name in ean.event_names])
+        return solution_from_event_times(ean, event_times), entry['objective'], ean
+
+    model = build_model(network, parameters, presolve=presolve, formulation=formulation, profile=profile,
+                        headways=headways)
+    ean = full_network(model)
+    mip_start = None
+    near = cache.nearest(structure)
+    if near is not None and all(name in near for name in ean.event_names):
+        mip_start = np.array([near[name] for name in ean.event_names])
+
+    fd, model_file = tempfile.mkstemp(suffix='.mps')
+    os.close(fd)
+    model.write(model_file)
+    solution_dict, cost = solve_model(model, mip_start=mip_start, profile=profile)
+
+    # Only final answers are cached, a time limit or interruption is not
+    if model._status in (GRB.OPTIMAL, GRB.INFEASIBLE):
+        event_times = {name: solution_dict[name] for name in ean.event_names} if solution_dict else None
+        status = 'optimal' if model._status == GRB.OPTIMAL else 'infeasible'
+        cache.store(key, structure, status, cost, event_times, model_file)
+    if os.path.exists(model_file):
+        os.remove(model_file)
+    return solution_dict, cost, ean
+
+
+def solve_heuristic(network, parameters=None, time_limit=5.0, seed=0):
+    # Solver-free timetable from the modulo network simplex, returns the event times as well so
+    # they can be passed to solve_model as MIP start
+    ean = build_event_activity_network(network, parameters)
+    event_times, solution_dict, cost, feasible = heuristic_timetable(ean, time_limit=time_limit, seed=seed)
+    if not feasible:
+        print(f"No feasible timetable found within {time_limit} seconds, best one violates some activities.")
+    return event_times, solution_dict, cost
+
+
+def generate_readable_timetable(solution_dict, ean):
+    # Event times in event ID order, then one columnar frame sorted by line, direction and the
+    # stop order of the network
+    event_times = timetable_array(ean, solution_dict)
+    timetable_df = timetable_frame(ean, event_times)
 
     return timetable_df
 
 def print_timetable(timetable_df):
-    for line in timetable_df['Line'].unique():
-        print(f"Line {line}:")
-        for direction in ['North', 'South']:
-            print(f"  Direction {direction}:")
-            filtered_df = timetable_df[(timetable_df['Line'] == line) & (timetable_df['Direction'] == direction)]
-            for index, row in filtered_df.iterrows():
-                print(f"    {row['Type']} {row['Station']} at {int(row['Time'])} minutes")
-            print()
-
-def runMain_Normal():
-    travel_times = read_basic_data()
-    model = build_model(travel_times)
-    solution_dict, cost = solve_model(model)
+    print(format_timetable(timetable_df), end='')
+
+def runMain_Normal(verbose=False, profile_path=None, output_path=None, use_cache=True, track_memory=False):
+    # With a profile_path the phase timings, model size and MIP trace are written as JSON
+    # (profile_path ending in .json) or as CSV files starting with profile_path.
+    # track_memory adds Python allocations per phase, it slows the run down so use a separate run for timings.
+    # With an output_path the timetable is also written to CSV or Parquet.
+    # With use_cache an unchanged instance is answered from the solution cache without Gurobi.
+    profile = RunProfile(track_memory) if profile_path else None
+
+    with phase(profile, 'read'):
+        network = read_basic_data()
+    if use_cache and not verbose:
+        solution_dict, cost, ean = solve_cached(network, profile=profile)
+    else:
+        model = build_model(network, verbose=verbose, profile=profile)
+        ean = full_network(model)
+        solution_dict, cost = solve_model(model, profile=profile)
 
     if solution_dict:
-        timetable_df = generate_readable_timetable(solution_dict)
-        print_timetable(timetable_df)
+        with phase(profile, 'render'):
+            timetable_df = generate_readable_timetable(solution_dict, ean)
+            print_timetable(timetable_df)
+            if output_path:
+                write_timetable(ean, timetable_array(ean, solution_dict), output_path)
+
+    if profile is not None:
+        profile.finish()
+        print(profile.summary())
+        if profile_path.endswith('.json'):
+            profile.to_json(profile_path)
+        else:
+            profile.to_csv(profile_path)
+
+
+def runMain_Heuristic(time_limit=5.0):
+    network = read_basic_data()
+    event_times, solution_dict, cost = solve_heuristic(network, time_limit=time_limit)
+    print(f"Heuristic timetable with total duration {cost}")
+
+    timetable_df = generate_readable_timetable(solution_dict, build_event_activity_network(network))
+    print_timetable(timetable_df)
+
+
+def runMain_Sweep(workers=None):
+    network = read_basic_data()
+    scenarios = scenario_grid(T=(30, 60), dwell_windows=((2, 8), (1, 5)), min_headway=(3, 5),
+                              pair_sets={'all': {}, 'no_headway': {'headway_pairs': []}})
+    results = run_sweep(network, scenarios, workers=workers, output_csv='sweep_results.csv')
+    print(results[['scenario', 'pairs', 'T', 'dwell_lower', 'dwell_upper', 'min_headway', 'status',
+                   'objective', 'solve_time']].to_string(index=False))
+
+
+def runMain_Decomposed(max_cluster_lines=2, workers=None, time_limit=None):
+    # Line-cluster decomposition instead of one monolithic MIP, for networks too large to solve at once
+    network = read_basic_data()
+    ean = build_event_activity_network(network)
+    result = decomposed_timetable(ean, max_cluster_lines=max_cluster_lines, workers=workers, time_limit=time_limit)
+    if result['feasible']:
+        print(f"Decomposed timetable with total duration {result['objective']}, "
+              f"lower bound {result['lower_bound']}, gap {100 * result['gap']:.2f}%")
+    else:
+        print("No timetable found that meets all coupling activities, best one violates:")
+        print(violation_report(ean, result['event_times']).to_string(index=False))
+
+    solution_dict = solution_from_event_times(ean, result['event_times'])
+    print_timetable(generate_readable_timetable(solution_dict, ean))
+
+
+def runMain_Robustness(num_scenarios=10000, heuristic_time=2.0):
+    # Punctuality of the optimal timetable under sampled primary delays, compared with the
+    # modulo network simplex timetable on the same scenarios
+    network = read_basic_data()
+    solution_dict, cost, ean = solve_cached(network)
+    if not solution_dict:
+        return
+    event_times = timetable_array(ean, solution_dict)
+    result = simulate_delays(ean, event_times, num_scenarios=num_scenarios)
+    print(f"Punctuality (arrivals within 3 minutes) {100 * result['punctuality']:.1f}%, "
+          f"mean delay {result['mean_delay']:.2f} min, knock-on {result['knock_on']:.2f} min")
+    print(result['per_line'].to_string(index=False))
+    print(result['per_station'].to_string(index=False))
+
+    heuristic_times, _, _ = solve_heuristic(network, time_limit=heuristic_time)
+    print(compare_timetables(ean, {'optimal': event_times, 'heuristic': heuristic_times},
+                             num_scenarios=num_scenarios).to_string(index=False))
+
+
+def runMain_Disruption(disruptions=(('delay', ('dep', 'Ut', '800', 'forward'), 4),), time_budget=2.0):
+    # Live re-timetabling: adjusts the solved timetable to the disruptions within time_budget seconds,
+    # see disruption.disrupted_network for the disruption tuples
+    network = read_basic_data()
+    solution_dict, cost, ean = solve_cached(network)
+    if not solution_dict:
+        return
+    result = retimetable(ean, timetable_array(ean, solution_dict), disruptions, time_budget=time_budget)
+    print(f"Re-timetabled with {result['method']} in {result['elapsed']:.3f} seconds, total duration "
+          f"{result['objective']} (was {cost}){'' if result['feasible'] else ', still violates the network'}")
+    if len(result['cancelled']):
+        print("Cancelled: " + ", ".join(result['cancelled']))
+    print(result['changes'].to_string(index=False))
+
+    running = ~np.isin(ean.event_names, result['cancelled'])
+    order = timetable_order(ean)
+    print_timetable(timetable_frame(ean, result['event_times'], order[running[order]]))
 
 
 if __name__ == "__main__":
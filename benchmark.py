@@ -0,0 +1,147 @@
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import time
+
+import pandas as pd
+
+from event_activity import build_event_activity_network
+from modulo_simplex import heuristic_timetable
+from network_generator import generate_network
+from presolve import presolve_network
+from timetable_checker import check_timetables
+
+# (lines, stations, corridors, hubs, sync pairs, transfers, headway pairs) per instance size
+SIZES = {
+    'xs': (5, 12, 2, 3, 3, 1, 8),
+    's': (10, 30, 3, 4, 5, 2, 16),
+    'm': (25, 70, 5, 6, 10, 4, 40),
+    'l': (60, 160, 8, 10, 20, 8, 100),
+    'xl': (150, 400, 12, 16, 40, 16, 250),
+}
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def benchmark_instance(size, seed=0, use_gurobi=True, time_limit=10.0, heuristic_time=2.0):
+    # Times every stage on one generated instance. Without Gurobi only the construction,
+    # presolve, heuristic and checker paths are measured.
+    lines, stations, corridors, hubs, syncs, transfers, headways = SIZES[size]
+    (network, parameters), generate_time = _timed(
+        generate_network, num_lines=lines, num_stations=stations, num_corridors=corridors, num_hubs=hubs,
+        num_sync_pairs=syncs, num_transfers=transfers, num_headway_pairs=headways, seed=seed)
+    ean, ean_time = _timed(build_event_activity_network, network, parameters)
+    (reduced, mapping), presolve_time = _timed(presolve_network, ean)
+
+    row = {
+        'size': size,
+        'seed': seed,
+        'lines': lines,
+        'events': ean.num_events,
+        'activities': ean.num_activities,
+        'reduced_events': reduced.num_events,
+        'reduced_activities': reduced.num_activities,
+        'generate_s': generate_time,
+        'build_network_s': ean_time,
+        'presolve_s': presolve_time,
+    }
+
+    # heuristic_s is the whole run including the stall phase, heuristic_best_s when the search found
+    # the timetable it returned (measured from the start of the search, after presolve)
+    history = []
+    (event_times, _, heuristic_cost, feasible), heuristic_s = _timed(
+        heuristic_timetable, ean, time_limit=heuristic_time, seed=seed, history=history)
+    check, check_s = _timed(check_timetables, ean, event_times)
+    row.update(heuristic_s=heuristic_s, heuristic_best_s=history[-1][0], heuristic_objective=heuristic_cost,
+               heuristic_feasible=feasible, check_s=check_s)
+
+    if use_gurobi:
+        from gurobipy import GurobiError
+        from cycle_model import build_cycle_model
+        from periodic_model import build_periodic_model, extract_solution, quiet_env
+
+        env = quiet_env(time_limit=time_limit)
+        for formulation, build in (('pesp', build_periodic_model), ('cycle', build_cycle_model)):
+            try:
+                model, build_s = _timed(build, reduced, env=env, postsolve=mapping)
+                model.update()
+                _, solve_s = _timed(model.optimize)
+                row[f"{formulation}_build_s"] = build_s
+                row[f"{formulation}_solve_s"] = solve_s
+                row[f"{formulation}_status"] = model.status
+                row[f"{formulation}_int_vars"] = model.NumIntVars
+                if model.SolCount > 0:
+                    row[f"{formulation}_objective"] = model.objVal
+                    row[f"{formulation}_gap"] = model.MIPGap
+                    _, row[f"{formulation}_extract_s"] = _timed(extract_solution, model)
+                model.dispose()
+            except GurobiError as error:
+                # e.g. a size-limited license on the larger instances
+                row[f"{formulation}_status"] = f"error: {error}"
+        env.dispose()
+    return row
+
+
+def run_benchmarks(sizes=('xs', 's', 'm'), seeds=(0,), use_gurobi=True, time_limit=10.0,
+                   heuristic_time=2.0, results_path='benchmark_results.jsonl'):
+    # Runs the suite and appends one JSON line per instance, tagged with the commit, so runs on
+    # different commits can be compared with compare_results
+    commit = _git_commit()
+    stamp = datetime.datetime.now().isoformat(timespec='seconds')
+    rows = []
+    for size in sizes:
+        for seed in seeds:
+            row = benchmark_instance(size, seed, use_gurobi, time_limit, heuristic_time)
+            row.update(commit=commit, timestamp=stamp, python=platform.python_version(), gurobi=use_gurobi)
+            rows.append(row)
+            print(f"{size:>3} seed {seed}: {row['events']} events, {row['activities']} activities, "
+                  f"build {row['build_network_s']:.3f}s, presolve {row['presolve_s']:.3f}s, "
+                  f"heuristic {row['heuristic_objective']:.0f} after {row['heuristic_best_s']:.3f}s")
+            if results_path:
+                with open(results_path, 'a') as f:
+                    f.write(json.dumps(row, default=str) + '\n')
+    return pd.DataFrame(rows)
+
+
+def compare_results(results_path='benchmark_results.jsonl', metric='build_network_s'):
+    # One column per commit, one row per instance size, with the median of the metric
+    results = pd.read_json(results_path, lines=True)
+    return results.pivot_table(index='size', columns='commit', values=metric, aggfunc='median')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Scaling benchmark on generated timetabling instances")
+    parser.add_argument('--sizes', nargs='+', default=['xs', 's', 'm'], choices=list(SIZES))
+    parser.add_argument('--seeds', nargs='+', type=int, default=[0])
+    parser.add_argument('--no-gurobi', action='store_true', help="only construction and heuristic paths")
+    parser.add_argument('--time-limit', type=float, default=10.0)
+    parser.add_argument('--heuristic-time', type=float, default=2.0)
+    parser.add_argument('--results', default='benchmark_results.jsonl')
+    parser.add_argument('--compare', metavar='METRIC', help="print the stored results per commit and exit")
+    args = parser.parse_args()
+
+    if args.compare:
+        print(compare_results(args.results, args.compare).to_string())
+    else:
+        use_gurobi = not args.no_gurobi
+        if use_gurobi:
+            try:
+                import gurobipy  # noqa: F401
+            except ImportError:
+                print("gurobipy is not available, running without Gurobi")
+                use_gurobi = False
+        run_benchmarks(args.sizes, args.seeds, use_gurobi, args.time_limit, args.heuristic_time, args.results)
@@ -0,0 +1,64 @@
+from gurobipy import Model, GRB
+import numpy as np
+import scipy.sparse as sp
+
+from ean_graph import augmented_arcs, spanning_tree, cycle_basis
+from event_activity import periodic_tensions
+
+
+def build_cycle_model(ean, name="TrainTimetabling", env=None, postsolve=None):
+    # Cycle-periodicity formulation: the spans x are the variables and for every cycle of an
+    # integral cycle basis sum(gamma_a * x_a) = T * z_c. This needs |A| - |E| + 1 integer z per
+    # connected component instead of one p_ij per activity.
+    model = Model(name, env=env)
+    T = ean.T
+
+    num_nodes, tail, head, lower, upper, num_arcs = augmented_arcs(ean)
+    origin = ean.num_events if num_nodes > ean.num_events else None
+    bfs_order, parent, tree_arc, depth = spanning_tree(num_nodes, tail, head, root_first=origin)
+    gamma = cycle_basis(tail, head, parent, tree_arc, depth)
+
+    # z is bounded by the smallest and largest length the cycle can take
+    forward = gamma.maximum(0)
+    backward = (-gamma).maximum(0)
+    z_lower = np.ceil((forward @ lower - backward @ upper) / T)
+    z_upper = np.floor((forward @ upper - backward @ lower) / T)
+
+    # One vector holds [x | z]
+    num_cycles = gamma.shape[0]
+    names = np.concatenate([
+        ean.activity_names,
+        np.array([f"origin_{ean.event_names[e]}" for e in head[ean.num_activities:]], dtype=object),
+        np.array([f"z_cycle_{c}" for c in range(num_cycles)], dtype=object),
+    ])
+    variables = model.addMVar(num_arcs + num_cycles, vtype=GRB.INTEGER, lb=np.concatenate([lower, z_lower]),
+                              ub=np.concatenate([upper, z_upper]), name=names)
+
+    # [Gamma | -T I] [x; z] = 0
+    model.addMConstr(sp.hstack([gamma, -T * sp.identity(num_cycles)], format='csr'), variables, '=',
+                     np.zeros(num_cycles), name=[f"cycle_{c}" for c in range(num_cycles)])
+
+    objective = np.concatenate([ean.activity_weight, np.zeros(num_arcs - ean.num_activities + num_cycles)])
+    model.setMObjective(None, objective, ean.objective_constant, sense=GRB.MINIMIZE)
+
+    def event_times(m):
+        # Walk down the spanning tree, every tree arc fixes the time of its child event
+        spans = np.rint(m._vars[:num_arcs].X)
+        times = np.zeros(num_nodes)
+        for v in bfs_order:
+            t = tree_arc[v]
+            if t < 0:
+                continue
+            if tail[t] == parent[v]:
+                times[v] = times[parent[v]] + spans[t]
+            else:
+                times[v] = times[parent[v]] - spans[t]
+        return np.mod(times[:ean.num_events], T)
+
+    model._ean = ean
+    model._vars = variables
+    model._postsolve = postsolve
+    model._event_times = event_times
+    model._set_start = lambda m, times: m._vars[:ean.num_activities].setAttr('Start', periodic_tensions(ean, times))
+
+    return model
@@ -0,0 +1,221 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from event_activity import subnetwork
+from presolve import presolve_network, PresolveInfeasible
+from timetable_checker import check_timetables
+
+# Gurobi environment of a pool process, see _init_worker
+_worker = {}
+
+
+def line_coupling(ean):
+    # L x L coupling weights between lines: every activity between two lines (sync, headway,
+    # transfer) counts 10, every station the two lines share counts 1
+    L = len(ean.line_names)
+    coupling = np.zeros((L, L))
+    line_tail = ean.event_line[ean.activity_tail]
+    line_head = ean.event_line[ean.activity_head]
+    between = line_tail != line_head
+    np.add.at(coupling, (line_tail[between], line_head[between]), 10.0)
+
+    stops = np.zeros((L, len(ean.stations)))
+    stops[ean.event_line, ean.event_station] = 1.0
+    coupling += stops @ stops.T
+    coupling = coupling + coupling.T
+    np.fill_diagonal(coupling, 0.0)
+    return coupling
+
+
+def cluster_lines(ean, max_cluster_lines=4):
+    # Greedy agglomeration along the strongest couplings (Kruskal on descending weight), two
+    # clusters are only merged while the result has at most max_cluster_lines lines.
+    # Returns the cluster number of every line.
+    coupling = line_coupling(ean)
+    L = len(ean.line_names)
+    parent = list(range(L))
+    size = [1] * L
+
+    def find(u):
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+
+    rows, cols = np.triu_indices(L, k=1)
+    for k in np.argsort(-coupling[rows, cols], kind='stable'):
+        if coupling[rows[k], cols[k]] <= 0:
+            break
+        ru, rv = find(rows[k]), find(cols[k])
+        if ru != rv and size[ru] + size[rv] <= max_cluster_lines:
+            parent[rv] = ru
+            size[ru] += size[rv]
+    roots = np.array([find(u) for u in range(L)])
+    return np.unique(roots, return_inverse=True)[1]
+
+
+def _subnetwork(ean, events, activities, fixed_times=None, soft=None, multipliers=None):
+    # subnetwork of a block. Activities marked in soft get the window [lower, lower + T - 1], which
+    # can always be met, and multipliers on top of their weight, so exceeding the real upper bound
+    # costs extra.
+    activity_upper = ean.activity_upper[activities].copy()
+    activity_weight = ean.activity_weight[activities].copy()
+    if soft is not None:
+        activity_upper[soft] = ean.activity_lower[activities][soft] + ean.T - 1
+        activity_weight[soft] += multipliers
+    return subnetwork(ean, events, activities, fixed_times, activity_upper=activity_upper,
+                      activity_weight=activity_weight)
+
+
+def _init_worker(threads, time_limit):
+    from periodic_model import quiet_env
+    _worker.update(env=quiet_env(threads, time_limit))
+
+
+def _solve_subproblem(sub_ean, start_times=None):
+    # Solves one cluster subproblem, returns (event times, objective, bound) or None without solution
+    from periodic_model import build_periodic_model, extract_solution, set_mip_start
+
+    try:
+        reduced, mapping = presolve_network(sub_ean)
+    except PresolveInfeasible:
+        return None
+    model = build_periodic_model(reduced, env=_worker['env'], postsolve=mapping)
+    if start_times is not None:
+        set_mip_start(model, start_times)
+    model.optimize()
+    result = None
+    if model.SolCount > 0:
+        event_times, _ = extract_solution(model)
+        result = (event_times, model.ObjVal, model.ObjBound)
+    model.dispose()
+    return result
+
+
+def _color_clusters(num_clusters, neighbours):
+    # Greedy coloring of the cluster graph, clusters of one color share no activity and can be
+    # re-optimized at the same time
+    color = np.full(num_clusters, -1)
+    for c in np.argsort([-len(n) for n in neighbours], kind='stable'):
+        used = {color[n] for n in neighbours[c]}
+        color[c] = next(k for k in range(num_clusters + 1) if k not in used)
+    return [np.flatnonzero(color == k) for k in range(color.max() + 1)]
+
+
+def decomposed_timetable(ean, max_cluster_lines=4, workers=None, threads=None, time_limit=None,
+                         max_rounds=10, verbose=True):
+    # Three steps:
+    # 1. lines are clustered along their coupling (cluster_lines)
+    # 2. every cluster is solved on its own in parallel, without the activities between clusters.
+    #    The sum of these optima plus the lower bounds of the coupling activities is a lower bound
+    #    for the whole network.
+    # 3. fix-and-optimize: a block of clusters is re-optimized with the events of all other
+    #    clusters fixed and the coupling activities to them included. A fixed neighbour can make
+    #    the hard coupling windows infeasible (e.g. rigid syncs around a cycle of clusters), so
+    #    those are relaxed Lagrangian-style: the span may go up to lower + T - 1 but carries a
+    #    multiplier that grows with the minutes it exceeded the upper bound in the last round.
+    #    Blocks are single clusters first, one color of the cluster graph in parallel. When a round
+    #    changes nothing, blocks grow to a cluster with all its neighbours, solved one by one.
+    # Returns a dict with the best event times, objective, lower bound, gap and the round history.
+    start = time.perf_counter()
+    workers = workers or os.cpu_count()
+    threads = threads or max(1, os.cpu_count() // workers)
+
+    event_cluster = cluster_lines(ean, max_cluster_lines)[ean.event_line]
+    num_clusters = event_cluster.max() + 1
+    cluster_tail = event_cluster[ean.activity_tail]
+    cluster_head = event_cluster[ean.activity_head]
+    coupling = np.flatnonzero(cluster_tail != cluster_head)
+    cluster_events = [np.flatnonzero(event_cluster == c) for c in range(num_clusters)]
+    internal = [np.flatnonzero((cluster_tail == c) & (cluster_head == c)) for c in range(num_clusters)]
+    neighbours = [set() for _ in range(num_clusters)]
+    for u, v in zip(cluster_tail[coupling], cluster_head[coupling]):
+        neighbours[u].add(v)
+        neighbours[v].add(u)
+    if verbose:
+        print(f"{num_clusters} clusters, {len(coupling)} coupling activities")
+
+    event_times = np.zeros(ean.num_events, dtype=np.int64)
+    multipliers = np.zeros(len(coupling))
+    lower_bound = float(ean.activity_weight[coupling] @ ean.activity_lower[coupling]) + ean.objective_constant
+    history = []
+
+    def submit_block(pool, clusters):
+        # Subproblem of the events in the given clusters, the rest of the timetable fixed
+        in_block = np.isin(event_cluster, clusters)
+        block_events = np.flatnonzero(in_block)
+        tail_in, head_in = in_block[ean.activity_tail], in_block[ean.activity_head]
+        inside = np.flatnonzero(tail_in & head_in)
+        touches = tail_in[coupling] != head_in[coupling]
+        touching = coupling[touches]
+        ends = np.concatenate([ean.activity_tail[touching], ean.activity_head[touching]])
+        boundary = np.unique(ends[~in_block[ends]])
+        events = np.concatenate([block_events, boundary])
+        soft = np.concatenate([np.zeros(len(inside), dtype=bool), np.ones(len(touching), dtype=bool)])
+        sub_ean = _subnetwork(ean, events, np.concatenate([inside, touching]),
+                              {e: event_times[e] for e in boundary}, soft, multipliers[touches])
+        return block_events, pool.submit(_solve_subproblem, sub_ean, event_times[events])
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(threads, time_limit)) as pool:
+        # Step 2: independent cluster subproblems
+        subproblems = [_subnetwork(ean, cluster_events[c], internal[c]) for c in range(num_clusters)]
+        for c, result in enumerate(pool.map(_solve_subproblem, subproblems)):
+            if result is None:
+                raise ValueError(f"Cluster {c} has no feasible timetable on its own, the network is infeasible")
+            event_times[cluster_events[c]], _, bound = result
+            lower_bound += bound
+
+        check = check_timetables(ean, event_times)
+        history.append({'round': 0, 'objective': float(check['objective']), 'feasible': bool(check['feasible']),
+                        'blocks': 'cluster', 'time': time.perf_counter() - start})
+        best = event_times.copy() if check['feasible'] else None
+        best_objective = float(check['objective']) if check['feasible'] else np.inf
+
+        # Step 3: fix-and-optimize, single clusters (parallel per color) and then neighbourhoods
+        stages = [('cluster', [[[c] for c in color] for color in _color_clusters(num_clusters, neighbours)]),
+                  ('neighbourhood', [[[c, *neighbours[c]]] for c in range(num_clusters)])]
+        # Without coupling activities the clusters are independent and step 2 is already optimal
+        rounds = max_rounds if len(coupling) else 0
+        stage = 0
+        for round_number in range(1, rounds + 1):
+            previous = event_times.copy()
+            for group in stages[stage][1]:
+                jobs = [submit_block(pool, block) for block in group]
+                for block_events, future in jobs:
+                    result = future.result()
+                    if result is not None:
+                        event_times[block_events] = result[0][:len(block_events)]
+
+            check = check_timetables(ean, event_times)
+            multipliers += check['excess'][coupling] * ean.activity_weight[coupling].max()
+            history.append({'round': round_number, 'objective': float(check['objective']),
+                            'feasible': bool(check['feasible']), 'blocks': stages[stage][0],
+                            'time': time.perf_counter() - start})
+            if verbose:
+                print(f"Round {round_number} ({stages[stage][0]}): objective {check['objective']:.0f}, "
+                      f"{'feasible' if check['feasible'] else 'coupling violated'}")
+            if check['feasible'] and check['objective'] < best_objective:
+                best, best_objective = event_times.copy(), float(check['objective'])
+            if np.array_equal(previous, event_times) or (check['feasible'] and history[-2]['feasible']
+                                                          and check['objective'] >= history[-2]['objective']):
+                if stage == len(stages) - 1:
+                    break
+                stage += 1
+
+    feasible = best is not None
+    if not feasible:
+        best, best_objective = event_times, float(check['objective'])
+    gap = (best_objective - lower_bound) / max(abs(best_objective), 1e-10) if feasible else None
+    return {
+        'event_times': best,
+        'objective': best_objective,
+        'feasible': feasible,
+        'lower_bound': lower_bound,
+        'gap': gap,
+        'clusters': int(num_clusters),
+        'history': history,
+    }
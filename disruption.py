@@ -0,0 +1,184 @@
+import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+from event_activity import RUN, event_name, subnetwork
+from modulo_simplex import heuristic_timetable
+from presolve import presolve_network, PresolveInfeasible
+from timetable_checker import check_timetables
+
+
+def _run_activities(ean, station_a, station_b, lines=()):
+    # Running activities from station_a to station_b, optionally only those of the given lines
+    runs = (ean.activity_type == RUN) \
+        & (ean.stations[ean.event_station[ean.activity_tail]] == station_a) \
+        & (ean.stations[ean.event_station[ean.activity_head]] == station_b)
+    if lines:
+        line_names = np.array(ean.line_names, dtype=object)[ean.event_line[ean.activity_tail]]
+        runs &= np.isin(line_names, list(lines))
+    return np.flatnonzero(runs)
+
+
+def disrupted_network(ean, event_times, disruptions):
+    # Applies the disruptions to the network, each one a tuple like the parameter lists:
+    #   ('delay', (event type, station, line, direction), minutes)  the event happens minutes later
+    #   ('travel_time', station_a, station_b, minutes, *lines)     running a -> b takes minutes
+    #   ('closed', station_a, station_b, *lines)                   no trains between a and b (both ways)
+    # Trains on a closed segment do not run it, their departure into and arrival from the segment
+    # are cancelled together with every activity at those events.
+    # Returns the disrupted network, the cancelled events (mask) and the events the changes touch.
+    T = ean.T
+    event_lower, event_upper = ean.event_lower.copy(), ean.event_upper.copy()
+    activity_lower, activity_upper = ean.activity_lower.copy(), ean.activity_upper.copy()
+    cancelled = np.zeros(ean.num_events, dtype=bool)
+    seeds = []
+    for disruption in disruptions:
+        kind = disruption[0]
+        if kind == 'delay':
+            _, event, minutes = disruption
+            e = ean.event_id[event_name(*event)]
+            event_lower[e] = event_upper[e] = (event_times[e] + minutes) % T
+            seeds.append([e])
+        elif kind == 'travel_time':
+            _, station_a, station_b, minutes, *lines = disruption
+            runs = _run_activities(ean, station_a, station_b, lines)
+            if len(runs) == 0:
+                raise ValueError(f"No train runs from {station_a} to {station_b}")
+            activity_lower[runs] = activity_upper[runs] = minutes
+            seeds += [ean.activity_tail[runs], ean.activity_head[runs]]
+        elif kind == 'closed':
+            _, station_a, station_b, *lines = disruption
+            runs = np.concatenate([_run_activities(ean, station_a, station_b, lines),
+                                   _run_activities(ean, station_b, station_a, lines)])
+            if len(runs) == 0:
+                raise ValueError(f"No train runs between {station_a} and {station_b}")
+            cancelled[ean.activity_tail[runs]] = True
+            cancelled[ean.activity_head[runs]] = True
+        else:
+            raise ValueError(f"Unknown disruption {kind!r}, expected 'delay', 'travel_time' or 'closed'")
+
+    # Activities at cancelled events go, the events at their other end are affected
+    dropped = cancelled[ean.activity_tail] | cancelled[ean.activity_head]
+    seeds += [ean.activity_tail[dropped], ean.activity_head[dropped]]
+    seeds = np.unique(np.concatenate(seeds)) if seeds else np.zeros(0, dtype=np.int64)
+    seeds = seeds[~cancelled[seeds]]
+
+    events = np.arange(ean.num_events)
+    fixed = {e: value for e, value in enumerate(event_lower) if value == event_upper[e]}
+    keep = np.flatnonzero(~dropped)
+    disrupted = subnetwork(ean, events, keep, fixed, activity_lower=activity_lower[keep],
+                           activity_upper=activity_upper[keep])
+    return disrupted, cancelled, seeds
+
+
+def _neighbourhood(ean, seeds, radius):
+    # Events within radius activities (in either direction) of the seed events
+    adjacency = sp.csr_matrix((np.ones(ean.num_activities), (ean.activity_tail, ean.activity_head)),
+                              shape=(ean.num_events, ean.num_events))
+    adjacency = adjacency + adjacency.T
+    region = np.zeros(ean.num_events, dtype=bool)
+    region[seeds] = True
+    for _ in range(radius):
+        grown = region | (adjacency @ region.astype(np.float64) > 0)
+        if np.array_equal(grown, region):
+            break
+        region = grown
+    return region
+
+
+def _region_network(ean, event_times, region):
+    # The region with every activity touching it, events outside the region fixed at their current time
+    touching = np.flatnonzero(region[ean.activity_tail] | region[ean.activity_head])
+    ends = np.concatenate([ean.activity_tail[touching], ean.activity_head[touching]])
+    boundary = np.unique(ends[~region[ends]])
+    events = np.concatenate([np.flatnonzero(region), boundary])
+    return events, subnetwork(ean, events, touching, {e: event_times[e] for e in boundary})
+
+
+def _solve_region(region_ean, start_times, time_limit, env):
+    # Periodic MIP on the region, starting from the current timetable. None if it has no solution.
+    from gurobipy import GRB
+    from periodic_model import build_periodic_model, extract_solution, set_mip_start
+
+    try:
+        reduced, mapping = presolve_network(region_ean)
+    except PresolveInfeasible:
+        return None
+    model = build_periodic_model(reduced, name="Retimetabling", env=env, postsolve=mapping)
+    model.Params.OutputFlag = 0
+    model.Params.TimeLimit = max(time_limit, 0.01)
+    set_mip_start(model, start_times)
+    model.optimize()
+    result = None
+    if model.SolCount > 0:
+        event_times, _ = extract_solution(model)
+        result = (event_times, 'mip' if model.status == GRB.OPTIMAL else 'mip_time_limit')
+    model.dispose()
+    return result
+
+
+def retimetable(ean, event_times, disruptions, time_budget=2.0, radius=4, env=None, seed=0):
+    # Adjusts a solved timetable to the disruptions within time_budget seconds:
+    # - everything outside the neighbourhood (radius activities around the affected events) stays fixed
+    # - the neighbourhood is re-optimized with the periodic MIP, starting from the current timetable
+    # - a neighbourhood without a feasible timetable is doubled while the budget allows it
+    # - without any MIP solution, the modulo network simplex gets what is left of the budget on the
+    #   last neighbourhood, and if that fails too only the disruptions themselves are applied
+    # Returns a dict with the new event times, the cancelled events, the method that produced the
+    # timetable, feasibility, objective, the changed events and the time used.
+    start = time.perf_counter()
+    deadline = start + time_budget
+    event_times = np.mod(np.rint(np.asarray(event_times)).astype(np.int64), ean.T)
+    disrupted, cancelled, seeds = disrupted_network(ean, event_times, disruptions)
+
+    new_times, method = (None, None) if len(seeds) else (event_times.copy(), 'unchanged')
+    while new_times is None and len(seeds) > 0:
+        region = _neighbourhood(disrupted, seeds, radius)
+        region &= ~cancelled
+        events, region_ean = _region_network(disrupted, event_times, region)
+        # Keep part of the budget for the heuristic fallback
+        result = _solve_region(region_ean, event_times[events], 0.7 * (deadline - time.perf_counter()), env)
+        if result is not None:
+            new_times = event_times.copy()
+            new_times[events] = result[0]
+            method = result[1]
+        elif region.sum() >= (~cancelled).sum() or time.perf_counter() >= deadline:
+            break
+        else:
+            radius *= 2
+
+    if new_times is None:
+        # Heuristic on the last neighbourhood, everything outside it keeps its current time
+        remaining = max(0.0, deadline - time.perf_counter())
+        try:
+            region_times, _, _, feasible = heuristic_timetable(region_ean, time_limit=remaining, seed=seed)
+        except PresolveInfeasible:
+            feasible = False
+        if feasible:
+            new_times = event_times.copy()
+            new_times[events] = region_times
+            method = 'heuristic'
+        else:
+            # Nothing found, the current timetable with the delayed events moved
+            fixed = disrupted.event_lower == disrupted.event_upper
+            new_times = np.where(fixed & ~cancelled, np.mod(disrupted.event_lower, ean.T), event_times)
+            method = 'unresolved'
+
+    check = check_timetables(disrupted, new_times)
+    changed = np.flatnonzero((new_times != event_times) & ~cancelled)
+    changes = pd.DataFrame({
+        'Event': ean.event_names[changed],
+        'Before': event_times[changed],
+        'After': new_times[changed],
+    })
+    return {
+        'event_times': new_times,
+        'cancelled': ean.event_names[cancelled],
+        'method': method,
+        'feasible': bool(check['feasible']),
+        'objective': float(check['objective']),
+        'changes': changes,
+        'elapsed': time.perf_counter() - start,
+    }
@@ -0,0 +1,127 @@
+from collections import deque
+
+import numpy as np
+import scipy.sparse as sp
+
+# Graph helpers on the event-activity network that do not need a solver
+
+
+def augmented_arcs(ean):
+    # Fixed events are tied to a virtual origin event (time 0) by an arc with a fixed span, so
+    # they end up in the cycles like any other constraint
+    E, A = ean.num_events, ean.num_activities
+    T = ean.T
+    fixed = np.flatnonzero(ean.event_lower == ean.event_upper)
+    free = (ean.event_lower <= 0) & (ean.event_upper >= T - 1)
+    if not np.all(free | (ean.event_lower == ean.event_upper)):
+        raise ValueError("Only events that are either fixed or free over the whole period are supported")
+
+    tail = np.concatenate([ean.activity_tail, np.full(len(fixed), E)])
+    head = np.concatenate([ean.activity_head, fixed])
+    lower = np.concatenate([ean.activity_lower, ean.event_lower[fixed] % T])
+    upper = np.concatenate([ean.activity_upper, ean.event_lower[fixed] % T])
+    num_nodes = E + 1 if len(fixed) else E
+    return num_nodes, tail, head, lower, upper, A + len(fixed)
+
+
+def find_root(parent, offset, e):
+    # Root of e in a weighted union-find (pi_e = pi_root + offset_e), with path compression
+    path = []
+    while parent[e] != e:
+        path.append(e)
+        e = parent[e]
+    root = e
+    total = 0
+    for node in reversed(path):
+        total += offset[node]
+        offset[node] = total
+        parent[node] = root
+    return root
+
+
+def merge_rigid(parent, offset, tail, head, span):
+    # Merges the chains of tail and head along an arc with a fixed span (pi_head = pi_tail + span).
+    # Returns None after the merge, or the length of the cycle the arc closes when both ends are
+    # in one chain already, that cycle is consistent if its length is a multiple of T.
+    root_tail = find_root(parent, offset, tail)
+    root_head = find_root(parent, offset, head)
+    tail_offset = offset[tail] if tail != root_tail else 0
+    head_offset = offset[head] if head != root_head else 0
+    length = tail_offset + span - head_offset
+    if root_tail == root_head:
+        return length
+    # pi_root_head = pi_head - head_offset = pi_tail + span - head_offset
+    parent[root_head] = root_tail
+    offset[root_head] = length
+    return None
+
+
+def spanning_tree(num_nodes, tail, head, root_first=None):
+    # Breadth-first spanning forest of the undirected activity graph.
+    # Returns the BFS order, parent event and tree arc of every event (-1 for the roots) and the depth.
+    arcs = np.arange(len(tail))
+    ends = np.concatenate([tail, head])
+    others = np.concatenate([head, tail])
+    arc_ids = np.concatenate([arcs, arcs])
+    order = np.argsort(ends, kind='stable')
+    adj_ptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    adj_ptr[1:] = np.cumsum(np.bincount(ends, minlength=num_nodes))
+    adj_node, adj_arc = others[order], arc_ids[order]
+
+    parent = np.full(num_nodes, -1, dtype=np.int64)
+    tree_arc = np.full(num_nodes, -1, dtype=np.int64)
+    depth = np.zeros(num_nodes, dtype=np.int64)
+    visited = np.zeros(num_nodes, dtype=bool)
+    bfs_order = []
+
+    starts = list(range(num_nodes))
+    if root_first is not None:
+        starts.insert(0, root_first)
+    for start in starts:
+        if visited[start]:
+            continue
+        visited[start] = True
+        queue = deque([start])
+        while queue:
+            u = queue.popleft()
+            bfs_order.append(u)
+            for k in range(adj_ptr[u], adj_ptr[u + 1]):
+                v = adj_node[k]
+                if not visited[v]:
+                    visited[v] = True
+                    parent[v] = u
+                    tree_arc[v] = adj_arc[k]
+                    depth[v] = depth[u] + 1
+                    queue.append(v)
+    return np.array(bfs_order, dtype=np.int64), parent, tree_arc, depth
+
+
+def cycle_basis(tail, head, parent, tree_arc, depth):
+    # Fundamental cycles of the spanning tree, one per non-tree arc. These form an integral cycle
+    # basis. Row c of the returned matrix holds +1/-1 for arcs traversed forward/backward.
+    num_arcs = len(tail)
+    in_tree = np.zeros(num_arcs, dtype=bool)
+    in_tree[tree_arc[tree_arc >= 0]] = True
+
+    rows, cols, vals = [], [], []
+    for c, a in enumerate(np.flatnonzero(~in_tree)):
+        rows.append(c)
+        cols.append(a)
+        vals.append(1)
+        # Close the cycle from head back to tail through the tree
+        u, v = head[a], tail[a]
+        while u != v:
+            if depth[u] >= depth[v]:
+                t = tree_arc[u]
+                rows.append(c)
+                cols.append(t)
+                vals.append(1 if tail[t] == u else -1)
+                u = parent[u]
+            else:
+                t = tree_arc[v]
+                rows.append(c)
+                cols.append(t)
+                vals.append(1 if head[t] == v else -1)
+                v = parent[v]
+    num_cycles = num_arcs - int(in_tree.sum())
+    return sp.csr_matrix((vals, (rows, cols)), shape=(num_cycles, num_arcs))
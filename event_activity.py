@@ -0,0 +1,292 @@
+import numpy as np
+import scipy.sparse as sp
+
+# Event types
+DEPARTURE = 0
+ARRIVAL = 1
+EVENT_TYPE_NAMES = ('dep', 'arr')
+
+# Directions, forward follows the stops as listed on the line, backward is the return trip
+FORWARD = 0
+BACKWARD = 1
+DIRECTION_NAMES = ('forward', 'backward')
+
+# Activity types
+RUN = 0
+DWELL = 1
+SYNC = 2
+HEADWAY = 3
+TRANSFER = 4
+ACTIVITY_TYPE_NAMES = ('run', 'dwell', 'sync', 'headway', 'transfer')
+
+# The parameters of the NS instance, these used to be hard-coded in build_model
+DEFAULT_PARAMETERS = {
+    'T': 30,  # The timetable cycle time in minutes
+    'dwell_time_lower': 2,
+    'dwell_time_upper': 8,
+    'sync_time': 15,
+    'min_headway_time': 3,
+    'transfer_time_lower': 2,
+    'transfer_time_upper': 5,
+    # (line1, line2, station1, station2): line2 departs sync_time after line1 at station1 (forward)
+    # and at station2 on the return trip
+    'sync_pairs': [
+        ('800', '3000', 'Amr', 'Asd'),
+        ('800', '3000', 'Asd', 'Ut'),
+        ('3100', '3500', 'Shl', 'Ut'),
+        ('3100', '3000', 'Ut', 'Nm'),
+        ('800', '3500', 'Ut', 'Ehv'),
+        ('800', '3900', 'Ehv', 'Std'),
+    ],
+    # (line1, line2, station, direction, event type): forward on the arrivals at Ut, backward on the departures
+    'headway_pairs': [
+        ('800', '3500', 'Ut', 'forward', 'arr'),
+        ('800', '3100', 'Ut', 'forward', 'arr'),
+        ('3000', '3500', 'Ut', 'forward', 'arr'),
+        ('3000', '3100', 'Ut', 'forward', 'arr'),
+        ('800', '3500', 'Ut', 'backward', 'dep'),
+        ('800', '3100', 'Ut', 'backward', 'dep'),
+        ('3000', '3500', 'Ut', 'backward', 'dep'),
+        ('3000', '3100', 'Ut', 'backward', 'dep'),
+    ],
+    # (line1, line2, station, direction): arrival of line1 to departure of line2.
+    # Switched off like in the original model, e.g. [('800', '3900', 'Ehv', 'forward'), ...]
+    'transfers': [],
+    # (event type, station, line, direction) -> fixed time, the 3500 leaves Schiphol at minute 9
+    'fixed_events': {
+        ('dep', 'Shl', '3500', 'forward'): 9,
+    },
+}
+
+
+def event_name(event_type, station, line, direction):
+    # Same naming as the original model: dep_Ut_800 and dep_Ut_800_return
+    suffix = '_return' if direction == 'backward' else ''
+    return f"{event_type}_{station}_{line}{suffix}"
+
+
+class EventActivityNetwork:
+    # Periodic event-activity network stored as flat arrays.
+    # Events are numbered 0..E-1 and activity a runs from event activity_tail[a] to
+    # activity_head[a] with a span in [activity_lower[a], activity_upper[a]] modulo T.
+
+    def __init__(self, T, event_names, event_type, event_station, event_line, event_direction,
+                 event_lower, event_upper, activity_names, activity_tail, activity_head,
+                 activity_lower, activity_upper, activity_weight, activity_type,
+                 stations, line_names, p_lower=None, p_upper=None, objective_constant=0.0, event_stop=None):
+        self.T = int(T)
+
+        self.event_names = np.asarray(event_names, dtype=object)
+        self.event_type = np.asarray(event_type, dtype=np.int8)
+        self.event_station = np.asarray(event_station, dtype=np.int64)
+        self.event_line = np.asarray(event_line, dtype=np.int64)
+        self.event_direction = np.asarray(event_direction, dtype=np.int8)
+        self.event_lower = np.asarray(event_lower, dtype=np.int64)
+        self.event_upper = np.asarray(event_upper, dtype=np.int64)
+        # Position of the stop along the direction of travel, used to order timetables
+        self.event_stop = (np.zeros(len(self.event_names), dtype=np.int64) if event_stop is None
+                           else np.asarray(event_stop, dtype=np.int64))
+
+        self.activity_names = np.asarray(activity_names, dtype=object)
+        self.activity_tail = np.asarray(activity_tail, dtype=np.int64)
+        self.activity_head = np.asarray(activity_head, dtype=np.int64)
+        self.activity_lower = np.asarray(activity_lower, dtype=np.int64)
+        self.activity_upper = np.asarray(activity_upper, dtype=np.int64)
+        self.activity_weight = np.asarray(activity_weight, dtype=np.float64)
+        self.activity_type = np.asarray(activity_type, dtype=np.int8)
+
+        # Domain of the modulo variables p_ij, by default p_ij >= 0 like in the original model
+        num_activities = len(self.activity_tail)
+        self.p_lower = np.zeros(num_activities) if p_lower is None else np.asarray(p_lower, dtype=np.float64)
+        self.p_upper = np.full(num_activities, np.inf) if p_upper is None else np.asarray(p_upper, dtype=np.float64)
+        self.objective_constant = float(objective_constant)
+
+        self.stations = np.asarray(stations, dtype=object)
+        self.line_names = list(line_names)
+        self.event_id = {name: k for k, name in enumerate(self.event_names)}
+
+        self._incidence = None
+
+    @property
+    def num_events(self):
+        return len(self.event_names)
+
+    @property
+    def num_activities(self):
+        return len(self.activity_tail)
+
+    def incidence_matrix(self):
+        # E x A matrix with -1 at the tail and +1 at the head of every activity, so B^T pi is the
+        # vector of (non-periodic) tensions pi_head - pi_tail
+        if self._incidence is None:
+            A = self.num_activities
+            rows = np.concatenate([self.activity_tail, self.activity_head])
+            cols = np.concatenate([np.arange(A), np.arange(A)])
+            vals = np.concatenate([-np.ones(A), np.ones(A)])
+            self._incidence = sp.csr_matrix((vals, (rows, cols)), shape=(self.num_events, A))
+        return self._incidence
+
+    def __repr__(self):
+        return f"EventActivityNetwork(T={self.T}, {self.num_events} events, {self.num_activities} activities)"
+
+
+def build_event_activity_network(network, parameters=None):
+    # Turns the lines of a RailNetwork into the periodic event-activity network, using
+    # DEFAULT_PARAMETERS for anything that is not given
+    params = dict(DEFAULT_PARAMETERS)
+    params.update(parameters or {})
+    T = params['T']
+
+    events = []  # (event type, station, line, direction)
+    event_stop = []
+    event_id = {}
+
+    def add_event(event_type, station, line, direction, stop):
+        event_id[(event_type, station, line, direction)] = len(events)
+        events.append((event_type, station, line, direction))
+        event_stop.append(stop)
+
+    # Same event set as before: departures everywhere but the last stop, arrivals everywhere but
+    # the first one, and the mirror image for the return trip
+    for line, stations in network.line_stations.items():
+        n = len(stations)
+        for k, station in enumerate(stations[:-1]):
+            add_event('dep', station, line, 'forward', k)
+        for k, station in enumerate(stations[1:], start=1):
+            add_event('arr', station, line, 'forward', k)
+        for k, station in enumerate(stations[1:], start=1):
+            add_event('dep', station, line, 'backward', n - 1 - k)
+        for k, station in enumerate(stations[:-1]):
+            add_event('arr', station, line, 'backward', n - 1 - k)
+
+    activities = []  # (name, tail, head, lower, upper, weight, type)
+
+    def add_activity(name, tail, head, lower, upper, activity_type, weight=1.0):
+        activities.append((name, event_id[tail], event_id[head], lower, upper, weight, activity_type))
+
+    for line, stations in network.line_stations.items():
+        # Running activities use the travel time as both bounds
+        for i in range(len(stations) - 1):
+            a, b = stations[i], stations[i + 1]
+            t = network.travel_time(a, b)
+            add_activity(f"run_{a}_{b}_{line}_forward", ('dep', a, line, 'forward'),
+                         ('arr', b, line, 'forward'), t, t, RUN)
+        for i in range(len(stations) - 1, 0, -1):
+            a, b = stations[i], stations[i - 1]
+            t = network.travel_time(a, b)
+            add_activity(f"run_{a}_{b}_{line}_backward", ('dep', a, line, 'backward'),
+                         ('arr', b, line, 'backward'), t, t, RUN)
+        # Dwelling at every intermediate stop
+        for i in range(1, len(stations) - 1):
+            s = stations[i]
+            add_activity(f"dwell_{s}_{line}_forward", ('arr', s, line, 'forward'),
+                         ('dep', s, line, 'forward'), params['dwell_time_lower'], params['dwell_time_upper'], DWELL)
+        for i in range(len(stations) - 2, 0, -1):
+            s = stations[i]
+            add_activity(f"dwell_{s}_{line}_backward", ('arr', s, line, 'backward'),
+                         ('dep', s, line, 'backward'), params['dwell_time_lower'], params['dwell_time_upper'], DWELL)
+
+    for line1, line2, station1, station2 in params['sync_pairs']:
+        add_activity(f"sync_{station1}_{station2}_{line1}_{line2}", ('dep', station1, line1, 'forward'),
+                     ('dep', station1, line2, 'forward'), params['sync_time'], params['sync_time'], SYNC)
+        add_activity(f"sync_{station2}_{station1}_{line1}_{line2}", ('dep', station2, line1, 'backward'),
+                     ('dep', station2, line2, 'backward'), params['sync_time'], params['sync_time'], SYNC)
+
+    # The headway only had a lower bound before; as it is minimised any span above
+    # min_headway_time + T - 1 can be lowered by T, so that is used as upper bound
+    min_headway = params['min_headway_time']
+    for line1, line2, station, direction, event_type in params['headway_pairs']:
+        add_activity(f"head_{line1}_{line2}_{direction}", (event_type, station, line1, direction),
+                     (event_type, station, line2, direction), min_headway, min_headway + T - 1, HEADWAY)
+
+    for line1, line2, station, direction in params['transfers']:
+        add_activity(f"transfer_{line1}_{line2}_{station}_{direction}", ('arr', station, line1, direction),
+                     ('dep', station, line2, direction), params['transfer_time_lower'],
+                     params['transfer_time_upper'], TRANSFER)
+
+    # Event times lie in [0, T], fixed events get a degenerate window
+    event_lower = np.zeros(len(events), dtype=np.int64)
+    event_upper = np.full(len(events), T, dtype=np.int64)
+    for key, value in params['fixed_events'].items():
+        event_lower[event_id[key]] = value
+        event_upper[event_id[key]] = value
+
+    names, tails, heads, lowers, uppers, weights, types = zip(*activities) if activities else ([],) * 7
+    return EventActivityNetwork(
+        T=T,
+        event_names=[event_name(*event) for event in events],
+        event_type=[EVENT_TYPE_NAMES.index(e[0]) for e in events],
+        event_station=[network.station_index[e[1]] for e in events],
+        event_line=[network.line_index[e[2]] for e in events],
+        event_direction=[DIRECTION_NAMES.index(e[3]) for e in events],
+        event_stop=event_stop,
+        event_lower=event_lower,
+        event_upper=event_upper,
+        activity_names=names,
+        activity_tail=tails,
+        activity_head=heads,
+        activity_lower=lowers,
+        activity_upper=uppers,
+        activity_weight=weights,
+        activity_type=types,
+        stations=network.stations,
+        line_names=network.line_names,
+    )
+
+
+def subnetwork(ean, events, activities, fixed_times=None, activity_lower=None, activity_upper=None,
+               activity_weight=None):
+    # The network restricted to the given events and activities (both ID arrays), with activity
+    # tails and heads renumbered. Events in fixed_times (event ID -> time) get a fixed window, the
+    # activity_* arrays (aligned with activities) replace the bounds and weights of the activities.
+    index = np.full(ean.num_events, -1, dtype=np.int64)
+    index[events] = np.arange(len(events))
+    event_lower = ean.event_lower[events].copy()
+    event_upper = ean.event_upper[events].copy()
+    for e, value in (fixed_times or {}).items():
+        event_lower[index[e]] = value
+        event_upper[index[e]] = value
+    return EventActivityNetwork(
+        T=ean.T,
+        event_names=ean.event_names[events],
+        event_type=ean.event_type[events],
+        event_station=ean.event_station[events],
+        event_line=ean.event_line[events],
+        event_direction=ean.event_direction[events],
+        event_stop=ean.event_stop[events],
+        event_lower=event_lower,
+        event_upper=event_upper,
+        activity_names=ean.activity_names[activities],
+        activity_tail=index[ean.activity_tail[activities]],
+        activity_head=index[ean.activity_head[activities]],
+        activity_lower=ean.activity_lower[activities] if activity_lower is None else activity_lower,
+        activity_upper=ean.activity_upper[activities] if activity_upper is None else activity_upper,
+        activity_weight=ean.activity_weight[activities] if activity_weight is None else activity_weight,
+        activity_type=ean.activity_type[activities],
+        stations=ean.stations,
+        line_names=ean.line_names,
+        p_lower=ean.p_lower[activities],
+        p_upper=ean.p_upper[activities],
+    )
+
+
+def periodic_tensions(ean, event_times):
+    # Smallest span x_a >= lower_a with x_a = pi_head - pi_tail (mod T), for one timetable or
+    # for a batch of timetables stacked along the first axis
+    event_times = np.asarray(event_times)
+    diff = event_times[..., ean.activity_head] - event_times[..., ean.activity_tail]
+    return ean.activity_lower + np.mod(diff - ean.activity_lower, ean.T)
+
+
+def solution_from_event_times(ean, event_times):
+    # Rebuilds the full variable assignment (events, spans and p_ij) from the event times alone,
+    # with the same variable names as the model so it can go straight into the timetable functions
+    event_times = np.rint(np.asarray(event_times, dtype=np.float64)).astype(np.int64)
+    tensions = periodic_tensions(ean, event_times)
+    diff = event_times[ean.activity_head] - event_times[ean.activity_tail]
+    p_values = (tensions - diff) // ean.T
+
+    solution_dict = dict(zip(ean.event_names, event_times.tolist()))
+    solution_dict.update(zip(ean.activity_names, tensions.tolist()))
+    solution_dict.update(zip((f"p_{a}" for a in ean.activity_names), p_values.tolist()))
+    return solution_dict
@@ -0,0 +1,115 @@
+import numpy as np
+
+from event_activity import EventActivityNetwork, HEADWAY, event_name
+
+
+def shared_segments(network):
+    # Directed track segments (a, b) that more than one line runs over, with the trains on them as
+    # (line, direction). The return trip of a line runs its segments from b to a.
+    segments = {}
+    for line, stations in network.line_stations.items():
+        for a, b in zip(stations[:-1], stations[1:]):
+            segments.setdefault((a, b), []).append((line, 'forward'))
+            segments.setdefault((b, a), []).append((line, 'backward'))
+    return {segment: trains for segment, trains in segments.items() if len(trains) > 1}
+
+
+def corridor_headways(network, ean, min_headway):
+    # Two-sided headways between every pair of trains on a shared segment: their departures at the
+    # start of the segment and their arrivals at the end must be at least min_headway apart in both
+    # directions, so the span lies in [min_headway, T - min_headway].
+    # Returns (names, tail, head, lower, upper) as arrays over the events of ean.
+    names, tails, heads = [], [], []
+    for (a, b), trains in shared_segments(network).items():
+        for i, (line1, direction1) in enumerate(trains):
+            for line2, direction2 in trains[i + 1:]:
+                for event_type, station in (('dep', a), ('arr', b)):
+                    names.append(f"corridor_head_{event_type}_{station}_{line1}_{direction1}_{line2}_{direction2}")
+                    tails.append(ean.event_id[event_name(event_type, station, line1, direction1)])
+                    heads.append(ean.event_id[event_name(event_type, station, line2, direction2)])
+    n = len(names)
+    return (np.array(names, dtype=object), np.array(tails, dtype=np.int64), np.array(heads, dtype=np.int64),
+            np.full(n, min_headway, dtype=np.int64), np.full(n, ean.T - min_headway, dtype=np.int64))
+
+
+def with_headways(ean, headways):
+    # The network with the corridor headways added as ordinary (weightless) activities, the eager mode
+    names, tails, heads, lower, upper = headways
+    n = len(names)
+    return EventActivityNetwork(
+        T=ean.T,
+        event_names=ean.event_names,
+        event_type=ean.event_type,
+        event_station=ean.event_station,
+        event_line=ean.event_line,
+        event_direction=ean.event_direction,
+        event_stop=ean.event_stop,
+        event_lower=ean.event_lower,
+        event_upper=ean.event_upper,
+        activity_names=np.concatenate([ean.activity_names, names]),
+        activity_tail=np.concatenate([ean.activity_tail, tails]),
+        activity_head=np.concatenate([ean.activity_head, heads]),
+        activity_lower=np.concatenate([ean.activity_lower, lower]),
+        activity_upper=np.concatenate([ean.activity_upper, upper]),
+        activity_weight=np.concatenate([ean.activity_weight, np.zeros(n)]),
+        activity_type=np.concatenate([ean.activity_type, np.full(n, HEADWAY)]),
+        stations=ean.stations,
+        line_names=ean.line_names,
+        p_lower=np.concatenate([ean.p_lower, np.zeros(n)]),
+        p_upper=np.concatenate([ean.p_upper, np.full(n, np.inf)]),
+        objective_constant=ean.objective_constant,
+    )
+
+
+def add_lazy_headways(model, headways):
+    # Lazy mode on a model from build_periodic_model: the span and modulo variable of every headway
+    # exist from the start, but the periodic constraint linking them to the event times is only
+    # added by lazy_headway_callback once an incumbent violates the headway.
+    # headways are given on the full network and are mapped onto the presolved events if needed.
+    from gurobipy import GRB
+
+    names, tails, heads, lower, upper = headways
+    ean = model._ean
+    T = ean.T
+    if model._postsolve is not None:
+        # pi_e = pi_rep + offset_e, with d = offset_head - offset_tail the span is shifted like in presolve
+        rep, offset = model._postsolve.event_rep, model._postsolve.event_offset
+        d = offset[heads] - offset[tails]
+        shift = d + ((lower - d) // T) * T
+        tails, heads, lower, upper = rep[tails], rep[heads], lower - shift, upper - shift
+
+    p_lower = np.ceil((lower - (ean.event_upper[heads] - ean.event_lower[tails])) / T)
+    p_upper = np.floor((upper - (ean.event_lower[heads] - ean.event_upper[tails])) / T)
+    spans = model.addMVar(len(names), vtype=GRB.INTEGER, lb=lower, ub=upper, name=names)
+    p = model.addMVar(len(names), vtype=GRB.INTEGER, lb=p_lower, ub=p_upper,
+                      name=np.array([f"p_{name}" for name in names], dtype=object))
+    model.Params.LazyConstraints = 1
+    model._lazy_headways = {
+        'tail': tails,
+        'head': heads,
+        'lower': lower,
+        'upper': upper,
+        'spans': spans.tolist(),
+        'p': p.tolist(),
+        'added': np.zeros(len(names), dtype=bool),
+    }
+    return model
+
+
+def lazy_headway_callback(model, where):
+    # Adds the periodic constraint of every headway the new incumbent violates
+    from gurobipy import GRB
+
+    if where != GRB.Callback.MIPSOL:
+        return
+    headways = model._lazy_headways
+    T = model._ean.T
+    events = model._vars[:model._ean.num_events]
+    event_times = np.rint(model.cbGetSolution(events))
+    diff = event_times[headways['head']] - event_times[headways['tail']]
+    spans = headways['lower'] + np.mod(diff - headways['lower'], T)
+    event_vars = events.tolist()
+    for k in np.flatnonzero(spans > headways['upper']):
+        tail, head = headways['tail'][k], headways['head'][k]
+        model.cbLazy(headways['spans'][k] == event_vars[head] - event_vars[tail] + T * headways['p'][k])
+        headways['added'][k] = True
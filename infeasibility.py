@@ -0,0 +1,192 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from ean_graph import augmented_arcs, find_root, merge_rigid
+from event_activity import RUN, DWELL, SYNC, HEADWAY, TRANSFER, EVENT_TYPE_NAMES
+
+
+def describe_activity(ean, a):
+    # Short planner-facing description of activity a, e.g. "sync 800/3000 at Asd"
+    line = lambda e: ean.line_names[ean.event_line[e]]
+    station = lambda e: ean.stations[ean.event_station[e]]
+    tail, head = ean.activity_tail[a], ean.activity_head[a]
+    kind = ean.activity_type[a]
+    if kind == RUN:
+        return f"run {station(tail)}-{station(head)} {line(tail)}"
+    if kind == DWELL:
+        return f"dwell {line(tail)} at {station(tail)}"
+    if kind == SYNC:
+        return f"sync {line(tail)}/{line(head)} at {station(tail)}"
+    if kind == HEADWAY:
+        return f"headway {line(tail)}/{line(head)} at {station(tail)}"
+    if kind == TRANSFER:
+        return f"transfer {line(tail)}->{line(head)} at {station(tail)}"
+    return str(ean.activity_names[a])
+
+
+def _describe_arc(ean, arc):
+    # Activities first, then one arc from the origin per fixed event
+    if arc < ean.num_activities:
+        return describe_activity(ean, arc)
+    e = _fixed_events(ean)[arc - ean.num_activities]
+    direction = ' return' if ean.event_direction[e] else ''
+    return (f"fixed {EVENT_TYPE_NAMES[ean.event_type[e]]} {ean.stations[ean.event_station[e]]} "
+            f"{ean.line_names[ean.event_line[e]]}{direction} at {ean.event_lower[e]}")
+
+
+def _fixed_events(ean):
+    return np.flatnonzero(ean.event_lower == ean.event_upper)
+
+
+def diagnose_network(ean, max_length=8, max_cycles=200000, max_conflicts=10, time_limit=0.5):
+    # Looks for cycles of the event-activity network whose length window cannot contain a
+    # multiple of T, which makes the periodic timetable infeasible. Fixed events are tied to a
+    # virtual origin, so conflicts with fixed departures show up as cycles as well.
+    # 1. Rigid activities (fixed span) and fixed events are merged with a weighted union-find, a
+    #    rigid arc that closes a chain with an inconsistent offset is a conflict right away. This is
+    #    the contraction of presolve_network, with a forest on top to report the conflicting chain.
+    # 2. The other activities are looked at between the rigid chains. Only cycles whose windows
+    #    add up to less than T - 1 minutes of slack can be infeasible, so a depth-first cycle
+    #    enumeration that stops at that slack stays small. On dense networks (e.g. eager corridor
+    #    headways) it can still take seconds, so it gives up after max_cycles steps or time_limit
+    #    seconds and the caller falls back to Gurobi's IIS.
+    # Returns a list of conflicts with the cycle in domain terms, possibly incomplete.
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+    T = ean.T
+    A = ean.num_activities
+    fixed = _fixed_events(ean)
+    num_nodes, tail, head, lower, upper, _ = augmented_arcs(ean)
+    width = upper - lower
+
+    conflicts = []
+
+    # Forest of rigid arcs, to recover the chain between two events of the same rigid component
+    forest = [[] for _ in range(num_nodes)]
+    parent = np.arange(num_nodes)
+    offset = np.zeros(num_nodes, dtype=np.int64)  # pi_node = pi_root + offset (mod T)
+
+    def rigid_path(u, v):
+        # Arcs (with direction sign) of the rigid forest path from u to v
+        previous = {u: None}
+        queue = deque([u])
+        while queue:
+            w = queue.popleft()
+            if w == v:
+                break
+            for x, arc, sign in forest[w]:
+                if x not in previous:
+                    previous[x] = (w, arc, sign)
+                    queue.append(x)
+        path = []
+        while previous[v] is not None:
+            w, arc, sign = previous[v]
+            path.append((arc, sign))
+            v = w
+        return path[::-1]
+
+    def add_conflict(kind, arcs, window):
+        conflicts.append({
+            'kind': kind,
+            'activities': [str(ean.activity_names[a]) if a < A else f"fixed_{ean.event_names[fixed[a - A]]}"
+                           for a, _ in arcs],
+            'description': ' + '.join(_describe_arc(ean, a) for a, _ in arcs),
+            'window': window,
+        })
+
+    # Step 1: rigid chains
+    for arc in np.flatnonzero(width == 0):
+        u, v = tail[arc], head[arc]
+        length = merge_rigid(parent, offset, u, v, lower[arc])
+        if length is not None:
+            if length % T != 0:
+                cycle = rigid_path(v, u) + [(arc, 1)]
+                add_conflict('rigid', cycle, (int(length), int(length)))
+                if len(conflicts) >= max_conflicts:
+                    return conflicts
+            continue
+        forest[u].append((v, arc, 1))
+        forest[v].append((u, arc, -1))
+
+    roots = np.array([find_root(parent, offset, u) for u in range(num_nodes)])
+    node_offset = np.where(roots == np.arange(num_nodes), 0, offset)
+
+    # Step 2: cycles over the narrow non-rigid arcs between rigid chains. With
+    # d = offset_head - offset_tail the arc spans [lower - d, upper - d] between the two roots.
+    narrow = np.flatnonzero((width > 0) & (width < T - 1))
+    d = node_offset[head[narrow]] - node_offset[tail[narrow]]
+    arc_lower = lower[narrow] - d
+    arc_upper = upper[narrow] - d
+    adjacency = {}
+    for k, arc in enumerate(narrow):
+        ru, rv = roots[tail[arc]], roots[head[arc]]
+        if ru == rv:
+            # Closes a cycle on its own together with the rigid chain between its ends
+            if np.floor(arc_upper[k] / T) * T < arc_lower[k]:
+                cycle = [(arc, 1)] + rigid_path(head[arc], tail[arc])
+                add_conflict('cycle', cycle, (int(arc_lower[k]), int(arc_upper[k])))
+                if len(conflicts) >= max_conflicts:
+                    return conflicts
+            continue
+        adjacency.setdefault(ru, []).append((rv, k, 1))
+        adjacency.setdefault(rv, []).append((ru, k, -1))
+
+    explored = 0
+    seen = set()
+    for start in sorted(adjacency):
+        # Depth-first over nodes larger than start, so every cycle is found from its smallest node once
+        stack = [(start, 0, 0, 0, [])]
+        while stack:
+            node, slack, low, high, path = stack.pop()
+            for neighbour, k, sign in adjacency[node]:
+                if path and path[-1][0] == k:
+                    continue
+                arc_low, arc_high = (arc_lower[k], arc_upper[k]) if sign > 0 else (-arc_upper[k], -arc_lower[k])
+                new_slack = slack + arc_high - arc_low
+                if new_slack >= T - 1:
+                    continue
+                new_low, new_high = low + arc_low, high + arc_high
+                new_path = path + [(k, sign, node, neighbour)]
+                explored += 1
+                if neighbour == start:
+                    # Every cycle is met once in each direction
+                    key = frozenset(step[0] for step in new_path)
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if np.floor(new_high / T) * T < new_low:
+                        add_conflict('cycle', _expand_cycle(new_path, narrow, tail, head, rigid_path),
+                                     (int(new_low), int(new_high)))
+                        if len(conflicts) >= max_conflicts:
+                            return conflicts
+                    continue
+                if neighbour < start or any(step[2] == neighbour for step in path) or len(new_path) >= max_length:
+                    continue
+                stack.append((neighbour, new_slack, new_low, new_high, new_path))
+            if explored >= max_cycles or (deadline is not None and time.perf_counter() >= deadline):
+                return conflicts
+    return conflicts
+
+
+def _expand_cycle(path, narrow, tail, head, rigid_path):
+    # Replaces every pass through a rigid chain by the rigid arcs it uses
+    arcs = []
+    for step, (k, sign, _, _) in enumerate(path):
+        arc = narrow[k]
+        arcs.append((arc, sign))
+        entry = head[arc] if sign > 0 else tail[arc]
+        next_k, next_sign = path[(step + 1) % len(path)][:2]
+        next_arc = narrow[next_k]
+        leave = tail[next_arc] if next_sign > 0 else head[next_arc]
+        if entry != leave:
+            arcs.extend(rigid_path(entry, leave))
+    return arcs
+
+
+def format_conflicts(conflicts):
+    lines = []
+    for k, conflict in enumerate(conflicts, start=1):
+        low, high = conflict['window']
+        lines.append(f"{k}. {conflict['description']} (cycle length between {low} and {high}, no multiple of the period)")
+    return '\n'.join(lines)
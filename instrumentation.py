@@ -0,0 +1,138 @@
+import contextlib
+import csv
+import json
+import time
+import tracemalloc
+
+import numpy as np
+
+from event_activity import ACTIVITY_TYPE_NAMES
+
+try:
+    import resource
+except ImportError:
+    # No getrusage on Windows, the phases then have no RSS figure
+    resource = None
+
+
+class RunProfile:
+    # Wall time and memory per phase (read, build, presolve, optimize, extract, render), model size
+    # statistics and the MIP progress trace of one run.
+    # track_memory adds Python allocations per phase through tracemalloc, which slows every
+    # allocation down many times over, so the wall times of such a run are not representative:
+    # profile memory and time in separate runs. Call finish() at the end of the run.
+
+    def __init__(self, track_memory=False):
+        self.phases = []
+        self.model_stats = {}
+        self.trace = []
+        self.track_memory = track_memory
+        self._start = time.perf_counter()
+        self._started_tracing = track_memory and not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+
+    def finish(self):
+        # Stops tracemalloc if this profile started it
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.track_memory = False
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.track_memory:
+            tracemalloc.reset_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                'phase': name,
+                'start': start - self._start,
+                'seconds': time.perf_counter() - start,
+                # Peak RSS of the process so far, in MB (ru_maxrss is in KB on Linux)
+                'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+            }
+            if self.track_memory:
+                current, peak = tracemalloc.get_traced_memory()
+                record['python_alloc_mb'] = (current - memory_before) / 2 ** 20
+                record['python_peak_mb'] = (peak - memory_before) / 2 ** 20
+            self.phases.append(record)
+
+    def record_model(self, model, ean=None, reduced=None):
+        # ean is the full network, reduced the presolved one the model was built on (if any)
+        model.update()
+        self.model_stats.update({
+            'variables': model.NumVars,
+            'integer_variables': model.NumIntVars,
+            'constraints': model.NumConstrs,
+            'nonzeros': model.NumNZs,
+        })
+        if ean is not None:
+            self.model_stats['events'] = ean.num_events
+            self.model_stats['activities'] = ean.num_activities
+            counts = np.bincount(ean.activity_type, minlength=len(ACTIVITY_TYPE_NAMES))
+            for type_name, count in zip(ACTIVITY_TYPE_NAMES, counts):
+                self.model_stats[f"{type_name}_activities"] = int(count)
+        if reduced is not None:
+            self.model_stats['reduced_events'] = reduced.num_events
+            self.model_stats['reduced_activities'] = reduced.num_activities
+
+    def mip_callback(self):
+        # Gurobi callback that records incumbent, best bound and gap whenever one of them changes
+        from gurobipy import GRB
+
+        def callback(model, where):
+            if where == GRB.Callback.MIP:
+                incumbent = model.cbGet(GRB.Callback.MIP_OBJBST)
+                bound = model.cbGet(GRB.Callback.MIP_OBJBND)
+            elif where == GRB.Callback.MIPSOL:
+                incumbent = model.cbGet(GRB.Callback.MIPSOL_OBJBST)
+                bound = model.cbGet(GRB.Callback.MIPSOL_OBJBND)
+            else:
+                return
+            if self.trace and self.trace[-1]['incumbent'] == incumbent and self.trace[-1]['bound'] == bound:
+                return
+            gap = abs(incumbent - bound) / max(abs(incumbent), 1e-10) if incumbent < GRB.INFINITY else None
+            self.trace.append({
+                'time': model.cbGet(GRB.Callback.RUNTIME),
+                'incumbent': incumbent,
+                'bound': bound,
+                'gap': gap,
+            })
+
+        return callback
+
+    def as_dict(self):
+        return {'phases': self.phases, 'model': self.model_stats, 'mip_trace': self.trace}
+
+    def to_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2, default=float)
+
+    def to_csv(self, prefix):
+        # Writes <prefix>_phases.csv, <prefix>_model.csv and <prefix>_mip_trace.csv
+        tables = {
+            'phases': self.phases,
+            'model': [self.model_stats] if self.model_stats else [],
+            'mip_trace': self.trace,
+        }
+        for name, rows in tables.items():
+            with open(f"{prefix}_{name}.csv", 'w', newline='') as f:
+                if rows:
+                    writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+                    writer.writeheader()
+                    writer.writerows(rows)
+
+    def summary(self):
+        lines = [f"{p['phase']:<10} {p['seconds'] * 1000:9.1f} ms"
+                 + (f"  rss {p['max_rss_mb']:7.1f} MB" if p['max_rss_mb'] is not None else '')
+                 for p in self.phases]
+        return '\n'.join(lines)
+
+
+def phase(profile, name):
+    # profile.phase(name), or nothing at all when running without a profile
+    return profile.phase(name) if profile is not None else contextlib.nullcontext()
@@ -0,0 +1,210 @@
+import time
+
+import numpy as np
+
+from ean_graph import augmented_arcs, spanning_tree
+from event_activity import periodic_tensions, solution_from_event_times
+from presolve import presolve_network
+
+
+def _arc_cost(diff, lower, upper, weight, T, penalty):
+    # Cost of the smallest periodic span for the given potential differences, spans above the
+    # upper bound are allowed but pay a penalty per minute
+    span = lower + np.mod(diff - lower, T)
+    return weight * span + penalty * np.maximum(span - upper, 0)
+
+
+def _tree_structure(num_nodes, tail, head, arc_order, root):
+    # Spanning forest that takes the arcs in the given order (Kruskal), rooted at the origin
+    parent = np.arange(num_nodes)
+
+    def find(u):
+        while parent[u] != u:
+            parent[u] = parent[parent[u]]
+            u = parent[u]
+        return u
+
+    chosen = []
+    for a in arc_order:
+        ru, rv = find(tail[a]), find(head[a])
+        if ru != rv:
+            parent[rv] = ru
+            chosen.append(a)
+    chosen = np.array(chosen, dtype=np.int64)
+
+    bfs_order, tree_parent, sub_arc, _ = spanning_tree(num_nodes, tail[chosen], head[chosen], root_first=root)
+    tree_arc = np.where(sub_arc >= 0, chosen[np.maximum(sub_arc, 0)], -1)
+
+    # Pre-order numbering, the subtree of v is every node u with tin[v] <= tin[u] < tout[v]
+    children = [[] for _ in range(num_nodes)]
+    for v in bfs_order:
+        if tree_parent[v] >= 0:
+            children[tree_parent[v]].append(v)
+    tin = np.zeros(num_nodes, dtype=np.int64)
+    tout = np.zeros(num_nodes, dtype=np.int64)
+    counter = 0
+    for root_node in bfs_order[tree_parent[bfs_order] < 0]:
+        stack = [(root_node, False)]
+        while stack:
+            v, done = stack.pop()
+            if done:
+                tout[v] = counter
+                continue
+            tin[v] = counter
+            counter += 1
+            stack.append((v, True))
+            stack.extend((c, False) for c in reversed(children[v]))
+    return bfs_order, tree_parent, tree_arc, tin, tout
+
+
+def _tree_potentials(bfs_order, tree_parent, tree_arc, tail, lower, num_nodes):
+    # Potentials with every tree arc at its lower bound
+    pi = np.zeros(num_nodes, dtype=np.int64)
+    for v in bfs_order:
+        t = tree_arc[v]
+        if t < 0:
+            continue
+        if tail[t] == tree_parent[v]:
+            pi[v] = pi[tree_parent[v]] + lower[t]
+        else:
+            pi[v] = pi[tree_parent[v]] - lower[t]
+    return pi
+
+
+def _best_shift(pi, in_cut, tail, head, lower, upper, weight, T, penalty):
+    # Best shift of all potentials inside the cut. Only the arcs crossing the cut change and the cost
+    # is piecewise linear in the shift, so it is enough to try the shifts that make a crossing arc tight.
+    crossing = np.flatnonzero(in_cut[tail] != in_cut[head])
+    if len(crossing) == 0:
+        return 0.0, 0
+    sign = np.where(in_cut[head[crossing]], 1, -1)
+    diff = pi[head[crossing]] - pi[tail[crossing]]
+    l, u, w = lower[crossing], upper[crossing], weight[crossing]
+
+    old_cost = _arc_cost(diff, l, u, w, T, penalty).sum()
+    shifts = np.unique(np.mod(sign * (l - diff), T))
+    shifts = shifts[shifts != 0]
+    if len(shifts) == 0:
+        return 0.0, 0
+    new_diff = diff[:, None] + sign[:, None] * shifts[None, :]
+    new_cost = _arc_cost(new_diff, l[:, None], u[:, None], w[:, None], T, penalty).sum(axis=0)
+    best = int(np.argmin(new_cost))
+    return float(old_cost - new_cost[best]), int(shifts[best])
+
+
+def modulo_network_simplex(ean, time_limit=5.0, seed=0, max_stall=200, history=None):
+    # Modulo network simplex (Nachtigall & Opitz) on the event-activity network.
+    # A spanning tree structure keeps its arcs at their lower bound, and a pivot shifts the
+    # fundamental cut of a tree arc until a non-tree arc becomes tight and enters the tree.
+    # When no pivot improves, single-node cuts are tried, and after that the best timetable so far
+    # is perturbed, until the time budget is used up or max_stall perturbations in a row did not
+    # lead to a better local optimum. Span violations are penalised rather than
+    # forbidden so the search can start from any tree.
+    # Every new best timetable is appended to history (if given) as (seconds since start, penalised cost).
+    # Returns the event times, the objective and whether all span windows are met.
+    start = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    T = ean.T
+    E = ean.num_events
+
+    num_nodes, tail, head, lower, upper, num_arcs = augmented_arcs(ean)
+    origin = E if num_nodes > E else None
+    weight = np.concatenate([ean.activity_weight, np.zeros(num_arcs - ean.num_activities)])
+    penalty = T * (weight.sum() + 1)
+    movable = np.arange(num_nodes) != origin
+
+    def total_cost(pi):
+        return float(_arc_cost(pi[head] - pi[tail], lower, upper, weight, T, penalty).sum())
+
+    # Initial tree structure: the narrowest span windows first, with all tree arcs at their lower bound
+    width = upper - lower
+    bfs_order, tree_parent, tree_arc, tin, tout = _tree_structure(
+        num_nodes, tail, head, np.argsort(width, kind='stable'), origin)
+    pi = np.mod(_tree_potentials(bfs_order, tree_parent, tree_arc, tail, lower, num_nodes), T)
+    cost = total_cost(pi)
+    best_pi, best_cost = pi.copy(), cost
+    stall = 0
+
+    def new_best():
+        if history is not None:
+            history.append((time.perf_counter() - start, best_cost))
+
+    new_best()
+
+    def out_of_time():
+        return time.perf_counter() - start >= time_limit
+
+    while not out_of_time():
+        best_gain, best_move = 0.0, None
+
+        # Pivots: the fundamental cut of tree arc (parent(v), v) is the subtree below v
+        for v in rng.permutation(np.flatnonzero(tree_arc >= 0)):
+            in_cut = (tin >= tin[v]) & (tin < tout[v])
+            gain, shift = _best_shift(pi, in_cut, tail, head, lower, upper, weight, T, penalty)
+            if gain > best_gain:
+                best_gain, best_move = gain, (in_cut, shift)
+            if out_of_time():
+                break
+
+        # No improving pivot left, try moving single events
+        if best_move is None and not out_of_time():
+            for v in rng.permutation(np.flatnonzero(movable)):
+                in_cut = np.zeros(num_nodes, dtype=bool)
+                in_cut[v] = True
+                gain, shift = _best_shift(pi, in_cut, tail, head, lower, upper, weight, T, penalty)
+                if gain > best_gain:
+                    best_gain, best_move = gain, (in_cut, shift)
+
+        if best_move is not None:
+            in_cut, shift = best_move
+            pi = np.mod(pi + shift * in_cut, T)
+            cost -= best_gain
+        else:
+            # Local optimum, keep it if it is the best one and kick the best timetable
+            if cost < best_cost:
+                best_pi, best_cost = pi.copy(), cost
+                stall = 0
+                new_best()
+            else:
+                stall += 1
+                if stall >= max_stall:
+                    break
+            pi = best_pi.copy()
+            candidates = np.flatnonzero((tree_arc >= 0) & movable)
+            if len(candidates) == 0:
+                break
+            v = rng.choice(candidates)
+            pi = np.mod(pi + rng.integers(1, T) * ((tin >= tin[v]) & (tin < tout[v])), T)
+            cost = total_cost(pi)
+
+        # New tree structure on the arcs that are tight now, narrow ones first
+        tight = np.mod(pi[head] - pi[tail] - lower, T) == 0
+        bfs_order, tree_parent, tree_arc, tin, tout = _tree_structure(
+            num_nodes, tail, head, np.lexsort((width, ~tight)), origin)
+
+    if cost < best_cost:
+        best_pi, best_cost = pi, cost
+        new_best()
+
+    event_times = best_pi[:E]
+    spans = periodic_tensions(ean, event_times)
+    feasible = bool(np.all(spans <= ean.activity_upper)) and bool(np.all(
+        (ean.event_lower != ean.event_upper) | (event_times == np.mod(ean.event_lower, T))))
+    objective = float(ean.activity_weight @ spans + ean.objective_constant)
+    return event_times, objective, feasible
+
+
+def heuristic_timetable(ean, time_limit=5.0, seed=0, presolve=True, max_stall=200, history=None):
+    # Runs the modulo network simplex on the presolved network and maps the timetable back.
+    # history is passed on to modulo_network_simplex.
+    # Returns the event times, a solution_dict for generate_readable_timetable, the cost and feasibility.
+    start = time.perf_counter()
+    work, mapping = presolve_network(ean) if presolve else (ean, None)
+    remaining = max(0.0, time_limit - (time.perf_counter() - start))
+    event_times, _, feasible = modulo_network_simplex(work, time_limit=remaining, seed=seed, max_stall=max_stall,
+                                                      history=history)
+    if mapping is not None:
+        event_times = mapping.expand(event_times)
+
+    cost = float(ean.activity_weight @ periodic_tensions(ean, event_times) + ean.objective_constant)
+    return event_times, solution_from_event_times(ean, event_times), cost, feasible
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+# Bump this whenever the layout of RailNetwork changes so old cache files are ignored
+CACHE_VERSION = 2
+DEFAULT_CACHE_DIR = '.network_cache'
+
+
+class RailNetwork:
+    # Indexed view of the 'Travel Times' and 'Lines' sheets.
+    # Stations and lines are numbered in order of first appearance, travel times are kept as a
+    # (from, to) -> minutes dict, which stays linear in the number of connections.
+
+    def __init__(self, line_stations, travel_times, line_frequencies=None):
+        self.line_names = list(line_stations.keys())
+        self.line_stations = {line: list(stations) for line, stations in line_stations.items()}
+        self.line_frequencies = dict(line_frequencies or {})
+
+        # Stations in order of first appearance on the lines, then any station only used in travel times
+        self.station_index = {}
+        for line_stops in self.line_stations.values():
+            for station in line_stops:
+                self.station_index.setdefault(station, len(self.station_index))
+        for (i, j) in travel_times:
+            for station in (i, j):
+                self.station_index.setdefault(station, len(self.station_index))
+        self.stations = np.array(list(self.station_index), dtype=object)
+        self.line_index = {line: k for k, line in enumerate(self.line_names)}
+
+        self.travel_times = {(i, j): int(t) for (i, j), t in travel_times.items()}
+
+    def travel_time(self, i, j):
+        try:
+            return self.travel_times[(i, j)]
+        except KeyError:
+            raise KeyError(f"No travel time from {i} to {j} in the network") from None
+
+    def __repr__(self):
+        return (f"RailNetwork({len(self.line_names)} lines, {len(self.stations)} stations, "
+                f"{len(self.travel_times)} connections)")
+
+
+def _parse_lines(lines):
+    # Every row is one line: Name, Frequency, then the stops spread over the remaining columns
+    line_stations = {}
+    line_frequencies = {}
+    for _, row in lines.iterrows():
+        name = str(int(row['Name'])) if isinstance(row['Name'], float) else str(row['Name'])
+        stops = [str(s) for s in row.iloc[2:].tolist() if pd.notna(s)]
+        line_stations[name] = stops
+        if 'Frequency' in row and pd.notna(row['Frequency']):
+            line_frequencies[name] = int(row['Frequency'])
+    return line_stations, line_frequencies
+
+
+def _parse_travel_times(travel_times):
+    return {
+        (str(i), str(j)): int(t)
+        for i, j, t in zip(travel_times['From'], travel_times['To'], travel_times['Travel Time'])
+    }
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_network(path='a2_part1.xlsx', cache_dir=DEFAULT_CACHE_DIR, use_cache=True):
+    # Reads the workbook once and keeps a pickled copy keyed by the file content hash,
+    # so later runs on an unchanged workbook skip the Excel parse completely.
+    cache_file = None
+    if use_cache and cache_dir is not None:
+        cache_file = os.path.join(cache_dir, f"{file_hash(path)}.v{CACHE_VERSION}.pkl")
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as f:
+                    return pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+                # Corrupt or outdated cache entry, fall through and rebuild it
+                pass
+
+    sheets = pd.read_excel(path, sheet_name=['Travel Times', 'Lines'])
+    line_stations, line_frequencies = _parse_lines(sheets['Lines'])
+    network = RailNetwork(line_stations, _parse_travel_times(sheets['Travel Times']), line_frequencies)
+
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Write to a temporary file first so a concurrent reader never sees half a pickle
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(network, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, cache_file)
+
+    return network
@@ -0,0 +1,166 @@
+import heapq
+
+import numpy as np
+
+from network import RailNetwork
+
+
+def _minimum_spanning_edges(coords):
+    # Prim on the complete euclidean graph, keeps the generated track network connected
+    n = len(coords)
+    in_tree = np.zeros(n, dtype=bool)
+    distance = np.full(n, np.inf)
+    nearest = np.zeros(n, dtype=np.int64)
+    distance[0] = 0
+    edges = []
+    for _ in range(n):
+        u = int(np.argmin(np.where(in_tree, np.inf, distance)))
+        in_tree[u] = True
+        if u != 0:
+            edges.append((int(nearest[u]), u))
+        d = np.linalg.norm(coords - coords[u], axis=1)
+        closer = ~in_tree & (d < distance)
+        distance[closer] = d[closer]
+        nearest[closer] = u
+    return edges
+
+
+def _shortest_path(adjacency, source, target):
+    # Dijkstra on the track network, returns the list of stations from source to target
+    best = {source: 0.0}
+    previous = {}
+    queue = [(0.0, source)]
+    while queue:
+        d, u = heapq.heappop(queue)
+        if u == target:
+            break
+        if d > best[u]:
+            continue
+        for v, w in adjacency[u]:
+            if d + w < best.get(v, np.inf):
+                best[v] = d + w
+                previous[v] = u
+                heapq.heappush(queue, (d + w, v))
+    path = [target]
+    while path[-1] != source:
+        path.append(previous[path[-1]])
+    return path[::-1]
+
+
+def generate_network(num_lines=10, num_stations=30, num_corridors=3, num_hubs=4, num_sync_pairs=4,
+                     num_transfers=2, num_headway_pairs=8, seed=0, speed=1.5, T=30):
+    # Seeded periodic railway instance shaped like the NS one: stations in a 200 x 200 km square,
+    # a connected track network, corridors between transfer hubs that several lines share, and
+    # sync, headway and transfer pairs between lines that meet. Sync pairs and transfers never
+    # close a cycle between line directions, so every generated instance is feasible.
+    # Returns the RailNetwork and the matching parameters for build_event_activity_network.
+    rng = np.random.default_rng(seed)
+    num_hubs = max(2, min(num_hubs, num_stations))
+    stations = [f"S{k}" for k in range(num_stations)]
+
+    # Hubs are spread out, the other stations cluster around them
+    hub_coords = rng.uniform(0, 200, size=(num_hubs, 2))
+    cluster = rng.integers(0, num_hubs, size=num_stations - num_hubs)
+    other_coords = hub_coords[cluster] + rng.normal(0, 30, size=(num_stations - num_hubs, 2))
+    coords = np.vstack([hub_coords, other_coords])
+
+    # Track network: spanning tree plus a link to the second nearest station for some redundancy
+    edges = set(tuple(sorted(e)) for e in _minimum_spanning_edges(coords))
+    for u in range(num_stations):
+        d = np.linalg.norm(coords - coords[u], axis=1)
+        d[u] = np.inf
+        edges.add(tuple(sorted((u, int(np.argsort(d)[1])))))
+    adjacency = [[] for _ in range(num_stations)]
+    travel_times = {}
+    for u, v in edges:
+        minutes = max(3, int(round(np.linalg.norm(coords[u] - coords[v]) / speed)))
+        adjacency[u].append((v, minutes))
+        adjacency[v].append((u, minutes))
+        travel_times[(stations[u], stations[v])] = minutes
+        travel_times[(stations[v], stations[u])] = minutes
+
+    # Corridors between pairs of hubs, every line runs over one of them and extends to both sides
+    hub_pairs = [(a, b) for a in range(num_hubs) for b in range(a + 1, num_hubs)]
+    corridors = [_shortest_path(adjacency, *hub_pairs[k]) for k in
+                 rng.choice(len(hub_pairs), size=min(num_corridors, len(hub_pairs)), replace=False)]
+    line_stations = {}
+    for k in range(num_lines):
+        corridor = corridors[k % len(corridors)]
+        start, end = rng.integers(0, num_stations, size=2)
+        path = _shortest_path(adjacency, int(start), corridor[0])[:-1] + corridor + \
+            _shortest_path(adjacency, corridor[-1], int(end))[1:]
+        # Drop loops so every station appears once on a line
+        stops = []
+        for s in path:
+            if s in stops:
+                stops = stops[:stops.index(s)]
+            stops.append(s)
+        if len(stops) < 2:
+            stops = list(corridor)
+        line_stations[str(100 * (k + 1))] = [stations[s] for s in stops]
+
+    # Union-find over line directions (chains) so couplings form a forest
+    chain_parent = {}
+
+    def find(chain):
+        chain_parent.setdefault(chain, chain)
+        while chain_parent[chain] != chain:
+            chain = chain_parent[chain]
+        return chain
+
+    def couple(chain1, chain2):
+        root1, root2 = find(chain1), find(chain2)
+        if root1 == root2:
+            return False
+        chain_parent[root2] = root1
+        return True
+
+    lines = list(line_stations)
+    segments = {}
+    for line in lines:
+        stops = line_stations[line]
+        for i in range(len(stops) - 1):
+            segments.setdefault((stops[i], stops[i + 1]), []).append(line)
+
+    # Sync on shared segments: forward at the first station, return trip at the second one
+    sync_pairs = []
+    candidates = [(l1, l2, s1, s2) for (s1, s2), on in segments.items()
+                  for i, l1 in enumerate(on) for l2 in on[i + 1:]]
+    for k in rng.permutation(len(candidates)):
+        if len(sync_pairs) >= num_sync_pairs:
+            break
+        l1, l2, s1, s2 = candidates[k]
+        if couple((l1, 'forward'), (l2, 'forward')) and couple((l1, 'backward'), (l2, 'backward')):
+            sync_pairs.append((l1, l2, s1, s2))
+
+    # Headways on the arrivals (forward) and departures (return trip) at stations on shared segments
+    headway_pairs = []
+    candidates = [(l1, l2, s2) for (s1, s2), on in segments.items()
+                  for i, l1 in enumerate(on) for l2 in on[i + 1:]]
+    for k in rng.permutation(len(candidates))[:num_headway_pairs // 2]:
+        l1, l2, station = candidates[k]
+        headway_pairs.append((l1, l2, station, 'forward', 'arr'))
+        headway_pairs.append((l1, l2, station, 'backward', 'dep'))
+
+    # Transfers at hubs between lines that both stop there
+    transfers = []
+    hubs = set(stations[:num_hubs])
+    candidates = [(l1, l2, s, direction) for l1 in lines for l2 in lines if l1 != l2
+                  for s in line_stations[l1][1:-1] if s in hubs and s in line_stations[l2][1:-1]
+                  for direction in ('forward', 'backward')]
+    for k in rng.permutation(len(candidates)):
+        if len(transfers) >= num_transfers:
+            break
+        l1, l2, station, direction = candidates[k]
+        if couple((l1, direction), (l2, direction)):
+            transfers.append((l1, l2, station, direction))
+
+    network = RailNetwork(line_stations, travel_times, {line: 2 for line in lines})
+    parameters = {
+        'T': T,
+        'sync_pairs': sync_pairs,
+        'headway_pairs': headway_pairs,
+        'transfers': transfers,
+        'fixed_events': {('dep', line_stations[lines[0]][0], lines[0], 'forward'): 0},
+    }
+    return network, parameters
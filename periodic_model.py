@@ -0,0 +1,88 @@
+from gurobipy import Env, Model, GRB
+import numpy as np
+import scipy.sparse as sp
+
+from event_activity import periodic_tensions, solution_from_event_times
+
+
+def build_periodic_model(ean, name="TrainTimetabling", env=None, postsolve=None):
+    # PESP model built in bulk from the incidence matrix of the event-activity network.
+    # One vector holds [pi | x | p]: event times, activity spans and the modulo variables, and
+    # every activity gets the periodic constraint x_a = pi_head - pi_tail + T * p_a.
+    model = Model(name, env=env)
+
+    E, A = ean.num_events, ean.num_activities
+    T = ean.T
+
+    lb = np.concatenate([ean.event_lower, ean.activity_lower, ean.p_lower])
+    ub = np.concatenate([ean.event_upper, ean.activity_upper, ean.p_upper])
+    names = np.concatenate([
+        ean.event_names,
+        ean.activity_names,
+        np.array([f"p_{activity}" for activity in ean.activity_names], dtype=object),
+    ])
+    variables = model.addMVar(E + 2 * A, vtype=GRB.INTEGER, lb=lb, ub=ub, name=names)
+
+    # [-B^T | I | -T I] [pi; x; p] = 0
+    identity = sp.identity(A, format='csr')
+    constraint_matrix = sp.hstack([-ean.incidence_matrix().T, identity, -T * identity], format='csr')
+    constraints = model.addMConstr(constraint_matrix, variables, '=', np.zeros(A),
+                                   name=[f"periodic_{activity}" for activity in ean.activity_names])
+
+    # Objective Function: Minimize the weighted total duration of activities
+    objective = np.concatenate([np.zeros(E), ean.activity_weight, np.zeros(A)])
+    model.setMObjective(None, objective, ean.objective_constant, sense=GRB.MINIMIZE)
+
+    # Keep the network and variable layout around for solution extraction
+    model._ean = ean
+    model._vars = variables
+    model._periodic_constrs = constraints
+    model._postsolve = postsolve
+    model._event_times = lambda m: m._vars[:E].X
+    model._set_start = _set_periodic_start
+
+    return model
+
+
+def _set_periodic_start(model, event_times):
+    ean = model._ean
+    spans = periodic_tensions(ean, event_times)
+    p_values = (spans - (event_times[ean.activity_head] - event_times[ean.activity_tail])) // ean.T
+    model._vars.Start = np.concatenate([event_times, spans, p_values])
+
+
+def set_mip_start(model, event_times):
+    # Uses a timetable of the full network (e.g. from the modulo network simplex) as MIP start
+    event_times = np.mod(np.rint(np.asarray(event_times)).astype(np.int64), model._ean.T)
+    if model._postsolve is not None:
+        event_times = model._postsolve.reduce(event_times)
+    model._set_start(model, event_times)
+
+
+def quiet_env(threads=None, time_limit=None):
+    # Gurobi environment without log output. A thread cap keeps parallel worker processes from
+    # competing for the same cores.
+    env = Env(empty=True)
+    env.setParam('OutputFlag', 0)
+    if threads is not None:
+        env.setParam('Threads', threads)
+    if time_limit is not None:
+        env.setParam('TimeLimit', time_limit)
+    env.start()
+    return env
+
+
+def full_network(model):
+    # The event-activity network the timetable is about, before any presolve
+    return model._ean if model._postsolve is None else model._postsolve.ean
+
+
+def extract_solution(model):
+    # Event times of the solved model, mapped back through presolve when there was one, and the
+    # full solution_dict (events, spans, p_ij) of the original network
+    ean = model._ean
+    event_times = np.mod(np.rint(model._event_times(model)).astype(np.int64), ean.T)
+    if model._postsolve is not None:
+        event_times = model._postsolve.expand(event_times)
+        ean = model._postsolve.ean
+    return event_times, solution_from_event_times(ean, event_times)
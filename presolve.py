@@ -0,0 +1,135 @@
+import numpy as np
+
+from ean_graph import find_root, merge_rigid
+from event_activity import EventActivityNetwork
+
+
+class PresolveInfeasible(ValueError):
+    pass
+
+
+class PresolveMapping:
+    # Every original event e is pi_e = (pi_rep[e] + offset[e]) mod T in the reduced network
+
+    def __init__(self, ean, event_rep, event_offset):
+        self.ean = ean
+        self.event_rep = event_rep
+        self.event_offset = event_offset
+
+    def expand(self, reduced_event_times):
+        reduced_event_times = np.asarray(reduced_event_times)
+        return np.mod(reduced_event_times[..., self.event_rep] + self.event_offset, self.ean.T)
+
+    def reduce(self, event_times):
+        # Reduced event times of a full timetable, e.g. to use it as a MIP start
+        event_times = np.asarray(event_times)
+        reps = np.unique(self.event_rep, return_index=True)[1]
+        return np.mod(event_times[..., reps] - self.event_offset[reps], self.ean.T)
+
+
+def presolve_network(ean):
+    # Reduces the periodic network before it goes to Gurobi:
+    # - activities with a fixed span (running, sync) are contracted, the head event becomes an
+    #   offset of the tail event and the activity with its p_ij disappears
+    # - fixed events fix the event representing their chain
+    # - activities that end up inside one chain or between two fixed chains are evaluated directly
+    # - the remaining spans are shifted into [0, T) and their p_ij get bounds from span arithmetic
+    T = ean.T
+    E = ean.num_events
+
+    full_window = (ean.event_lower <= 0) & (ean.event_upper >= T - 1)
+    fixed_event = ean.event_lower == ean.event_upper
+    if not np.all(full_window | fixed_event):
+        raise ValueError("Presolve only supports events that are either fixed or free over the whole period")
+
+    parent = np.arange(E)
+    offset = np.zeros(E, dtype=np.int64)
+    objective_constant = ean.objective_constant
+
+    fixed_activity = ean.activity_lower == ean.activity_upper
+    for a in np.flatnonzero(fixed_activity):
+        span = ean.activity_lower[a]
+        length = merge_rigid(parent, offset, ean.activity_tail[a], ean.activity_head[a], span)
+        if length is not None and length % T != 0:
+            raise PresolveInfeasible(f"Fixed activity {ean.activity_names[a]} closes an inconsistent chain")
+        objective_constant += ean.activity_weight[a] * span
+
+    roots = np.array([find_root(parent, offset, e) for e in range(E)])
+    offset = np.where(roots == np.arange(E), 0, np.mod(offset, T))
+
+    # Fixed events pin the time of their representative
+    root_value = {}
+    for e in np.flatnonzero(fixed_event):
+        value = (ean.event_lower[e] - offset[e]) % T
+        if root_value.setdefault(roots[e], value) != value:
+            raise PresolveInfeasible(f"Fixed event {ean.event_names[e]} conflicts with another fixed event")
+
+    rep_events = np.unique(roots)
+    rep_index = np.full(E, -1, dtype=np.int64)
+    rep_index[rep_events] = np.arange(len(rep_events))
+    event_lower = np.zeros(len(rep_events), dtype=np.int64)
+    event_upper = np.full(len(rep_events), T - 1, dtype=np.int64)
+    for root, value in root_value.items():
+        event_lower[rep_index[root]] = value
+        event_upper[rep_index[root]] = value
+
+    # Remaining activities in terms of the representatives: with d = offset_head - offset_tail the span is
+    # x = pi_rep_head - pi_rep_tail + d + T p, so the reduced span x - d - kT gets the bounds shifted by d + kT
+    keep = []
+    lowers, uppers = [], []
+    for a in np.flatnonzero(~fixed_activity):
+        tail, head = ean.activity_tail[a], ean.activity_head[a]
+        lower, upper, weight = ean.activity_lower[a], ean.activity_upper[a], ean.activity_weight[a]
+        d = offset[head] - offset[tail]
+        rep_tail, rep_head = rep_index[roots[tail]], rep_index[roots[head]]
+
+        both_fixed = roots[tail] in root_value and roots[head] in root_value
+        if rep_tail == rep_head or both_fixed:
+            if rep_tail != rep_head:
+                d += root_value[roots[head]] - root_value[roots[tail]]
+            span = lower + (d - lower) % T
+            if span > upper:
+                raise PresolveInfeasible(f"Activity {ean.activity_names[a]} cannot meet its span window")
+            objective_constant += weight * span
+            continue
+
+        shift = d + ((lower - d) // T) * T
+        keep.append(a)
+        lowers.append(lower - shift)
+        uppers.append(upper - shift)
+        objective_constant += weight * shift
+
+    keep = np.array(keep, dtype=np.int64)
+    lowers = np.array(lowers, dtype=np.int64)
+    uppers = np.array(uppers, dtype=np.int64)
+    tails = rep_index[roots[ean.activity_tail[keep]]]
+    heads = rep_index[roots[ean.activity_head[keep]]]
+
+    # x = pi_head - pi_tail + T p with both event times inside their windows bounds p
+    p_lower = np.ceil((lowers - (event_upper[heads] - event_lower[tails])) / T)
+    p_upper = np.floor((uppers - (event_lower[heads] - event_upper[tails])) / T)
+
+    reduced = EventActivityNetwork(
+        T=T,
+        event_names=ean.event_names[rep_events],
+        event_type=ean.event_type[rep_events],
+        event_station=ean.event_station[rep_events],
+        event_line=ean.event_line[rep_events],
+        event_direction=ean.event_direction[rep_events],
+        event_stop=ean.event_stop[rep_events],
+        event_lower=event_lower,
+        event_upper=event_upper,
+        activity_names=ean.activity_names[keep],
+        activity_tail=tails,
+        activity_head=heads,
+        activity_lower=lowers,
+        activity_upper=uppers,
+        activity_weight=ean.activity_weight[keep],
+        activity_type=ean.activity_type[keep],
+        stations=ean.stations,
+        line_names=ean.line_names,
+        p_lower=p_lower,
+        p_upper=p_upper,
+        objective_constant=objective_constant,
+    )
+    return reduced, PresolveMapping(ean, rep_index[roots], offset)
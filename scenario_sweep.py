@@ -0,0 +1,148 @@
+import csv
+import itertools
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from gurobipy import GRB
+
+from event_activity import build_event_activity_network
+from presolve import presolve_network, PresolveInfeasible
+from solution_cache import SolutionCache, instance_key, solver_settings
+
+STATUS_NAMES = {
+    GRB.OPTIMAL: 'optimal',
+    GRB.INFEASIBLE: 'infeasible',
+    GRB.INF_OR_UNBD: 'inf_or_unbd',
+    GRB.UNBOUNDED: 'unbounded',
+    GRB.TIME_LIMIT: 'time_limit',
+    GRB.INTERRUPTED: 'interrupted',
+}
+
+# Set once per worker process by _init_worker
+_worker = {}
+
+
+def scenario_grid(T=(30,), dwell_windows=((2, 8),), min_headway=(3,), sync_time=(15,), pair_sets=None):
+    # Cartesian product of the parameter values. pair_sets maps a label to the active
+    # 'sync_pairs' / 'headway_pairs' of that variant, e.g. {'no_headway': {'headway_pairs': []}}
+    pair_sets = pair_sets or {'all': {}}
+    scenarios = []
+    for k, (t, dwell, headway, sync, pairs) in enumerate(
+            itertools.product(T, dwell_windows, min_headway, sync_time, pair_sets.items())):
+        parameters = {
+            'T': t,
+            'dwell_time_lower': dwell[0],
+            'dwell_time_upper': dwell[1],
+            'min_headway_time': headway,
+            'sync_time': sync,
+        }
+        parameters.update(pairs[1])
+        scenarios.append({'scenario': k, 'pairs': pairs[0], 'parameters': parameters})
+    return scenarios
+
+
+def _init_worker(network, threads, time_limit, formulation, cache_dir=None):
+    # Every worker gets its own Gurobi environment with a thread cap. With a cache_dir all
+    # workers share one solution cache.
+    from periodic_model import quiet_env
+    cache = SolutionCache(cache_dir) if cache_dir is not None else None
+    _worker.update(network=network, env=quiet_env(threads, time_limit), formulation=formulation, cache=cache)
+
+
+def _solve_scenario(scenario):
+    from cycle_model import build_cycle_model
+    from periodic_model import build_periodic_model, extract_solution
+
+    parameters = scenario['parameters']
+    row = {
+        'scenario': scenario['scenario'],
+        'pairs': scenario['pairs'],
+        'T': parameters['T'],
+        'dwell_lower': parameters['dwell_time_lower'],
+        'dwell_upper': parameters['dwell_time_upper'],
+        'min_headway': parameters['min_headway_time'],
+        'sync_time': parameters['sync_time'],
+        'worker': os.getpid(),
+    }
+
+    cache = _worker['cache']
+    if cache is not None:
+        key, structure = instance_key(_worker['network'], parameters, solver_settings(_worker['formulation']))
+        entry = cache.lookup(key)
+        if entry is not None:
+            row.update(status=entry['status'], objective=entry['objective'], build_time=0.0, solve_time=0.0,
+                       timetable=entry['event_times'])
+            return row
+
+    start = time.perf_counter()
+    ean = build_event_activity_network(_worker['network'], parameters)
+    try:
+        reduced, mapping = presolve_network(ean)
+    except PresolveInfeasible:
+        row.update(status='infeasible', objective=None, build_time=time.perf_counter() - start,
+                   solve_time=0.0, timetable=None)
+        if cache is not None:
+            cache.store(key, structure, 'infeasible', None)
+        return row
+
+    build = build_cycle_model if _worker['formulation'] == 'cycle' else build_periodic_model
+    model = build(reduced, env=_worker['env'], postsolve=mapping)
+    build_time = time.perf_counter() - start
+    if cache is not None:
+        fd, model_file = tempfile.mkstemp(suffix='.mps')
+        os.close(fd)
+        model.write(model_file)
+
+    model.optimize()
+    row.update(status=STATUS_NAMES.get(model.status, str(model.status)), build_time=build_time,
+               solve_time=model.Runtime)
+    if model.SolCount > 0:
+        event_times, _ = extract_solution(model)
+        row['objective'] = model.objVal
+        row['timetable'] = dict(zip(ean.event_names, event_times.tolist()))
+    else:
+        row['objective'] = None
+        row['timetable'] = None
+    if cache is not None:
+        if row['status'] in ('optimal', 'infeasible'):
+            cache.store(key, structure, row['status'], row['objective'], row['timetable'], model_file)
+        if os.path.exists(model_file):
+            os.remove(model_file)
+    model.dispose()
+    return row
+
+
+def iter_sweep(network, scenarios, workers=None, threads=None, time_limit=None, formulation='pesp',
+               cache_dir=None):
+    # Solves the scenarios on a process pool and yields every result row as soon as it is done
+    workers = workers or os.cpu_count()
+    threads = threads or max(1, os.cpu_count() // workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(network, threads, time_limit, formulation, cache_dir)) as pool:
+        futures = [pool.submit(_solve_scenario, scenario) for scenario in scenarios]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def run_sweep(network, scenarios, workers=None, threads=None, time_limit=None, formulation='pesp',
+              output_csv=None, cache_dir=None):
+    # Collects the sweep into one results table, appending each row to output_csv as it arrives
+    rows = []
+    writer = None
+    f = open(output_csv, 'w', newline='') if output_csv else None
+    try:
+        for row in iter_sweep(network, scenarios, workers, threads, time_limit, formulation, cache_dir):
+            rows.append(row)
+            if f is not None:
+                if writer is None:
+                    writer = csv.DictWriter(f, fieldnames=list(row.keys()))
+                    writer.writeheader()
+                writer.writerow(row)
+                f.flush()
+    finally:
+        if f is not None:
+            f.close()
+    return pd.DataFrame(rows).sort_values('scenario').reset_index(drop=True)
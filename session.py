@@ -0,0 +1,128 @@
+import copy
+
+from gurobipy import GRB
+import numpy as np
+import pandas as pd
+
+from event_activity import (DEFAULT_PARAMETERS, DWELL, SYNC, HEADWAY, build_event_activity_network,
+                            event_name)
+from periodic_model import build_periodic_model, extract_solution, set_mip_start
+
+
+class TimetableSession:
+    # Keeps one built model alive while the planner changes parameters.
+    # Every parameter is a bound of the (unpresolved) PESP model, so an update only changes bounds
+    # (and the p_ij coefficients for a new cycle time) and the next solve starts from the last timetable.
+
+    def __init__(self, network, parameters=None, env=None, output_flag=0):
+        # Deep copy after merging, fix_event must not change the caller's 'fixed_events'
+        self.parameters = copy.deepcopy(dict(DEFAULT_PARAMETERS, **(parameters or {})))
+        self.ean = build_event_activity_network(network, self.parameters)
+        self.model = build_periodic_model(self.ean, env=env)
+        self.model.Params.OutputFlag = output_flag
+        self.model.update()
+
+        self.event_times = None
+        self.solution_dict = None
+        self.cost = None
+        self.status = None
+
+    def set_cycle_time(self, T):
+        ean = self.ean
+        ean.T = int(T)
+        # The periodic rows are x - pi_head + pi_tail - T p = 0, only the p_ij coefficient changes
+        E, A = ean.num_events, ean.num_activities
+        p_vars = self.model._vars[E + A:].tolist()
+        for constr, p_var in zip(self.model._periodic_constrs.tolist(), p_vars):
+            self.model.chgCoeff(constr, p_var, -ean.T)
+        free = ean.event_lower != ean.event_upper
+        ean.event_upper[free] = ean.T
+        self.parameters['T'] = ean.T
+        # The headway upper bound follows the cycle time
+        self.set_min_headway(self.parameters['min_headway_time'])
+
+    def set_dwell_bounds(self, lower, upper):
+        self._set_span(DWELL, lower, upper)
+        self.parameters['dwell_time_lower'] = lower
+        self.parameters['dwell_time_upper'] = upper
+
+    def set_sync_time(self, sync_time):
+        self._set_span(SYNC, sync_time, sync_time)
+        self.parameters['sync_time'] = sync_time
+
+    def set_min_headway(self, min_headway):
+        self._set_span(HEADWAY, min_headway, min_headway + self.ean.T - 1)
+        self.parameters['min_headway_time'] = min_headway
+
+    def fix_event(self, event, value):
+        # event is (event type, station, line, direction) like the keys of 'fixed_events',
+        # a value of None releases the event again
+        e = self.ean.event_id[event_name(*event)]
+        if value is None:
+            self.ean.event_lower[e], self.ean.event_upper[e] = 0, self.ean.T
+            self.parameters['fixed_events'].pop(event, None)
+        else:
+            self.ean.event_lower[e] = self.ean.event_upper[e] = value
+            self.parameters['fixed_events'][event] = value
+        self._push_bounds()
+
+    def update(self, T=None, dwell_bounds=None, sync_time=None, min_headway=None, fixed_events=None):
+        # Several parameter changes at once, e.g. session.update(T=20, fixed_events={key: 9})
+        if T is not None:
+            self.set_cycle_time(T)
+        if dwell_bounds is not None:
+            self.set_dwell_bounds(*dwell_bounds)
+        if sync_time is not None:
+            self.set_sync_time(sync_time)
+        if min_headway is not None:
+            self.set_min_headway(min_headway)
+        for event, value in (fixed_events or {}).items():
+            self.fix_event(event, value)
+
+    def _set_span(self, activity_type, lower, upper):
+        selected = self.ean.activity_type == activity_type
+        self.ean.activity_lower[selected] = lower
+        self.ean.activity_upper[selected] = upper
+        self._push_bounds()
+
+    def _push_bounds(self):
+        # Copy the event and span windows of the network into the model bounds in one go
+        ean = self.ean
+        E, A = ean.num_events, ean.num_activities
+        self.model._vars[:E + A].lb = np.concatenate([ean.event_lower, ean.activity_lower])
+        self.model._vars[:E + A].ub = np.concatenate([ean.event_upper, ean.activity_upper])
+
+    def solve(self):
+        # Re-optimize from the previous timetable and report which events moved
+        previous = self.event_times
+        if previous is not None:
+            set_mip_start(self.model, previous)
+
+        self.model.optimize()
+        self.status = self.model.status
+        if self.model.status != GRB.OPTIMAL and self.model.SolCount == 0:
+            self.event_times, self.solution_dict, self.cost = None, None, None
+            return None
+
+        self.event_times, self.solution_dict = extract_solution(self.model)
+        self.cost = self.model.objVal
+        return self.changes(previous, self.event_times)
+
+    def changes(self, before, after):
+        # Events whose time differs between two timetables
+        ean = self.ean
+        if before is None:
+            moved = np.ones(ean.num_events, dtype=bool)
+            before = np.full(ean.num_events, np.nan)
+        else:
+            moved = before != after
+        return pd.DataFrame({
+            'Event': ean.event_names[moved],
+            'Line': np.array(ean.line_names, dtype=object)[ean.event_line[moved]],
+            'Station': ean.stations[ean.event_station[moved]],
+            'Before': before[moved],
+            'After': after[moved],
+        }).reset_index(drop=True)
+
+    def close(self):
+        self.model.close()
@@ -0,0 +1,172 @@
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows, the cache then relies on the atomic renames alone
+    fcntl = None
+
+from event_activity import DEFAULT_PARAMETERS
+
+# Bump this whenever the layout of a cache entry changes so old entries are ignored
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = '.solution_cache'
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def _digest(data):
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def canonical_instance(network, parameters=None):
+    # Everything the timetable depends on, in a form that does not depend on dict or list order:
+    # the stops of every line, the travel times the lines actually use and the full parameter set
+    params = dict(DEFAULT_PARAMETERS)
+    params.update(parameters or {})
+    lines = {str(line): [str(s) for s in stations] for line, stations in network.line_stations.items()}
+    travel = sorted({(a, b, int(network.travel_time(a, b)))
+                     for stations in lines.values()
+                     for i in range(len(stations) - 1)
+                     for a, b in ((stations[i], stations[i + 1]), (stations[i + 1], stations[i]))})
+    canonical_params = {}
+    for name, value in params.items():
+        if name == 'fixed_events':
+            value = sorted([list(map(str, key)), int(minute)] for key, minute in value.items())
+        elif isinstance(value, (list, tuple)):
+            value = sorted(list(map(str, item)) for item in value)
+        canonical_params[name] = value
+    return {'lines': lines, 'travel_times': travel, 'parameters': canonical_params}
+
+
+def solver_settings(formulation='pesp', presolve=True, headways=None):
+    # The settings that can change the answer. Time limits are left out on purpose, only final
+    # answers (optimal or infeasible) are stored and those do not depend on them.
+    import gurobipy
+    return {'formulation': formulation, 'presolve': presolve, 'headways': headways,
+            'gurobi': list(gurobipy.gurobi.version())}
+
+
+def instance_key(network, parameters=None, settings=None):
+    # Content hash of the instance and the solver settings, plus a structure hash of the line stops
+    # only: instances with the same structure share their events, so their timetables are MIP starts
+    instance = canonical_instance(network, parameters)
+    key = _digest({'version': CACHE_VERSION, 'instance': instance, 'settings': settings or {}})
+    structure = _digest({'version': CACHE_VERSION, 'lines': instance['lines']})
+    return key, structure
+
+
+class SolutionCache:
+    # Content-addressed store of built models (MPS) and solved timetables, one directory per key:
+    #   <cache_dir>/<key>/model.mps      the model as it went to Gurobi
+    #   <cache_dir>/<key>/entry.json     status, objective, structure hash and the timetable
+    # Entries are written to a temporary directory and renamed into place, so readers never see a
+    # partial entry. Writers and eviction hold an flock on <cache_dir>/.lock, the least recently
+    # used entries (by modification time, refreshed on every hit) go once max_bytes is exceeded.
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with open(os.path.join(self.cache_dir, '.lock'), 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _entries(self):
+        # (key, path) of every complete entry
+        for key in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, key)
+            if not key.startswith('.') and os.path.isfile(os.path.join(path, 'entry.json')):
+                yield key, path
+
+    def _read(self, path):
+        try:
+            with open(os.path.join(path, 'entry.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # Evicted in the meantime or corrupt, treat it as a miss
+            return None
+
+    def lookup(self, key):
+        # The stored entry of key or None, a hit counts as a use for the LRU order
+        path = os.path.join(self.cache_dir, key)
+        entry = self._read(path)
+        if entry is not None:
+            with contextlib.suppress(OSError):
+                os.utime(path)
+            entry['model_path'] = os.path.join(path, 'model.mps')
+        return entry
+
+    def nearest(self, structure):
+        # Timetable (event name -> time) of the most recently used solved entry with the same
+        # structure, meant as MIP start for an instance that only differs in its parameters
+        best, best_time = None, -1.0
+        for key, path in self._entries():
+            try:
+                modified = os.path.getmtime(path)
+            except OSError:
+                continue
+            if modified <= best_time:
+                continue
+            entry = self._read(path)
+            if entry is not None and entry['structure'] == structure and entry['event_times']:
+                best, best_time = entry['event_times'], modified
+        return best
+
+    def store(self, key, structure, status, objective, event_times=None, model_file=None):
+        # Stores the result under key, together with the model file (moved into the entry) when given.
+        # An entry another process stored first is kept.
+        final = os.path.join(self.cache_dir, key)
+        tmp = os.path.join(self.cache_dir, f".{key}.{os.getpid()}.tmp")
+        os.makedirs(tmp, exist_ok=True)
+        try:
+            if model_file is not None:
+                shutil.move(model_file, os.path.join(tmp, 'model.mps'))
+            with open(os.path.join(tmp, 'entry.json'), 'w') as f:
+                json.dump({
+                    'key': key,
+                    'structure': structure,
+                    'status': status,
+                    'objective': objective,
+                    'event_times': event_times,
+                    'created': time.time(),
+                }, f)
+            with self._locked():
+                if not os.path.exists(final):
+                    os.rename(tmp, final)
+                self._evict()
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def _evict(self):
+        # Drops least recently used entries until the cache fits in max_bytes, caller holds the lock
+        entries = []
+        for key, path in self._entries():
+            try:
+                size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+                entries.append((os.path.getmtime(path), size, path))
+            except OSError:
+                continue
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+    def clear(self):
+        with self._locked():
+            for _, path in list(self._entries()):
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+from delay_simulation import DEFAULT_DWELL_DELAY, DEFAULT_RUN_DELAY, PROPAGATING, simulate_delays
+from event_activity import ARRIVAL, DWELL, RUN, SYNC, build_event_activity_network, periodic_tensions
+from modulo_simplex import heuristic_timetable
+from network import load_network
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope='module')
+def timetable():
+    ean = build_event_activity_network(load_network(os.path.join(HERE, 'a2_part1.xlsx'), use_cache=False))
+    event_times, _, _, _ = heuristic_timetable(ean, time_limit=1.0)
+    return ean, event_times
+
+
+def _sampled_primary(ean, num_scenarios, periods, seed):
+    # The primary delays simulate_delays draws for a single batch, in the same order
+    rng = np.random.default_rng(seed)
+    primary = np.zeros((periods, ean.num_activities, num_scenarios))
+    for k in range(periods):
+        for mask, (probability, mean) in ((ean.activity_type == RUN, DEFAULT_RUN_DELAY),
+                                          (ean.activity_type == DWELL, DEFAULT_DWELL_DELAY)):
+            n = int(mask.sum())
+            hit = rng.random((n, num_scenarios)) < probability
+            primary[k, mask] = np.where(hit, rng.exponential(mean, (n, num_scenarios)), 0.0)
+    return primary
+
+
+def _reference(ean, event_times, primary, periods, warmup):
+    # Plain fixed-point iteration per scenario and period over every propagating activity,
+    # without levels or reduceat
+    spans = periodic_tensions(ean, event_times)
+    p = (spans - (event_times[ean.activity_head] - event_times[ean.activity_tail])) // ean.T
+    slack = spans - ean.activity_lower
+    activities = np.flatnonzero(np.isin(ean.activity_type, PROPAGATING))
+    same_line = ean.event_line[ean.activity_tail] == ean.event_line[ean.activity_head]
+    num_scenarios = primary.shape[2]
+
+    def fixed_point(subset, s):
+        # d[k, j] = max(0, max over a in subset into j of d[k - p_a, tail] + primary - slack)
+        d = np.zeros((periods, ean.num_events))
+        changed = True
+        while changed:
+            changed = False
+            for k in range(periods):
+                for a in subset:
+                    source = d[k - p[a], ean.activity_tail[a]] if k - p[a] >= 0 else 0.0
+                    candidate = source + primary[k, a, s] - slack[a]
+                    if candidate > d[k, ean.activity_head[a]]:
+                        d[k, ean.activity_head[a]] = candidate
+                        changed = True
+        return d[warmup:]
+
+    delay = np.zeros((ean.num_events, num_scenarios))
+    knock_on = np.zeros((ean.num_events, num_scenarios))
+    for s in range(num_scenarios):
+        # Own delay only ever travels along the activities within a line
+        d = fixed_point(activities, s)
+        own = fixed_point(activities[same_line[activities]], s)
+        delay[:, s] = d.mean(axis=0)
+        knock_on[:, s] = (d - own).mean(axis=0)
+    arrivals = ean.event_type == ARRIVAL
+    return delay.mean(axis=1)[arrivals].mean(), knock_on.mean(axis=1)[arrivals].mean()
+
+
+def test_matches_fixed_point_reference(timetable):
+    ean, event_times = timetable
+    num_scenarios, periods, warmup = 20, 3, 1
+    result = simulate_delays(ean, event_times, num_scenarios=num_scenarios, periods=periods, warmup=warmup)
+    primary = _sampled_primary(ean, num_scenarios, periods, seed=0)
+    mean_delay, knock_on = _reference(ean, event_times, primary, periods, warmup)
+    assert result['mean_delay'] == pytest.approx(mean_delay)
+    assert result['knock_on'] == pytest.approx(knock_on)
+
+
+def test_sync_passes_on_knock_on(timetable):
+    # A line synced with zero slack behind another takes over its delay, which is knock-on all the
+    # way down the line even though the sync ends on a departure and only arrivals are measured
+    ean, event_times = timetable
+    slack = periodic_tensions(ean, event_times) - ean.activity_lower
+    rigid_syncs = np.flatnonzero((ean.activity_type == SYNC) & (slack == 0))
+    assert len(rigid_syncs) > 0
+    synced_lines = {ean.line_names[l] for l in ean.event_line[ean.activity_head[rigid_syncs]]}
+    result = simulate_delays(ean, event_times, num_scenarios=200, run_delay=(1.0, 5.0))
+    per_line = result['per_line'].set_index('Line')
+    for line in synced_lines:
+        assert per_line.loc[line, 'knock_on'] > 0
+
+
+def test_periods_must_exceed_warmup(timetable):
+    ean, event_times = timetable
+    with pytest.raises(ValueError):
+        simulate_delays(ean, event_times, num_scenarios=10, periods=1, warmup=1)
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pytest
+from gurobipy import GRB
+
+from benchmark import SIZES
+from event_activity import build_event_activity_network
+from network import load_network
+from network_generator import generate_network
+from periodic_model import build_periodic_model, extract_solution, quiet_env
+from presolve import presolve_network
+from timetable_checker import check_timetables
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _ns():
+    return build_event_activity_network(load_network(os.path.join(HERE, 'a2_part1.xlsx'), use_cache=False))
+
+
+def _generated(size, seed):
+    lines, stations, corridors, hubs, syncs, transfers, headways = SIZES[size]
+    network, parameters = generate_network(
+        num_lines=lines, num_stations=stations, num_corridors=corridors, num_hubs=hubs, num_sync_pairs=syncs,
+        num_transfers=transfers, num_headway_pairs=headways, seed=seed)
+    return build_event_activity_network(network, parameters)
+
+
+# Small enough for a size-limited Gurobi license without presolve
+INSTANCES = {'ns': _ns, 'xs-0': lambda: _generated('xs', 0), 'xs-1': lambda: _generated('xs', 1),
+             'xs-2': lambda: _generated('xs', 2), 's-0': lambda: _generated('s', 0)}
+
+
+@pytest.fixture(scope='module')
+def env():
+    env = quiet_env()
+    yield env
+    env.dispose()
+
+
+def _solve(ean, env, presolve):
+    # Status, objective and full-network event times of the PESP model with or without presolve
+    work, mapping = presolve_network(ean) if presolve else (ean, None)
+    model = build_periodic_model(work, env=env, postsolve=mapping)
+    model.optimize()
+    status, objective, event_times = model.status, None, None
+    if status == GRB.OPTIMAL:
+        objective = model.ObjVal
+        event_times, _ = extract_solution(model)
+    model.dispose()
+    return status, objective, event_times
+
+
+@pytest.mark.parametrize('name', sorted(INSTANCES))
+def test_presolve_keeps_the_optimum(name, env):
+    ean = INSTANCES[name]()
+    status, objective, event_times = _solve(ean, env, presolve=True)
+    plain_status, plain_objective, plain_event_times = _solve(ean, env, presolve=False)
+    assert status == plain_status == GRB.OPTIMAL
+    assert objective == pytest.approx(plain_objective)
+    for times, value in ((event_times, objective), (plain_event_times, plain_objective)):
+        check = check_timetables(ean, times)
+        assert check['feasible']
+        assert check['objective'] == pytest.approx(value)
+
+
+@pytest.mark.parametrize('name', sorted(INSTANCES))
+def test_reduce_expand_round_trip(name):
+    ean = INSTANCES[name]()
+    reduced, mapping = presolve_network(ean)
+    assert reduced.num_events < ean.num_events
+    rng = np.random.default_rng(0)
+
+    # Any reduced timetable survives expand then reduce, also as a batch
+    reduced_times = rng.integers(0, ean.T, size=(5, reduced.num_events))
+    np.testing.assert_array_equal(mapping.reduce(mapping.expand(reduced_times)), reduced_times)
+
+    # A full timetable that respects the contracted chains survives reduce then expand
+    event_times = mapping.expand(reduced_times[0])
+    np.testing.assert_array_equal(mapping.expand(mapping.reduce(event_times)), event_times)
+    assert event_times.shape == (ean.num_events,)
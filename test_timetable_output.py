@@ -0,0 +1,57 @@
+import os
+
+import pandas as pd
+
+from event_activity import build_event_activity_network, solution_from_event_times
+from modulo_simplex import heuristic_timetable
+from network import load_network
+from timetable_output import format_timetable, timetable_frame
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# The hard-coded station order the NS printout used before it came from the network
+STATION_ORDER = {
+    ('3000', 'North'): ['Nm', 'Ut', 'Asd', 'Amr', 'Hdr'],
+    ('3000', 'South'): ['Hdr', 'Amr', 'Asd', 'Ut', 'Nm'],
+    ('800', 'North'): ['Mt', 'Std', 'Ehv', 'Ut', 'Asd', 'Amr'],
+    ('800', 'South'): ['Amr', 'Asd', 'Ut', 'Ehv', 'Std', 'Mt'],
+    ('3100', 'North'): ['Nm', 'Ut', 'Shl'],
+    ('3100', 'South'): ['Shl', 'Ut', 'Nm'],
+    ('3500', 'North'): ['Vl', 'Ehv', 'Ut', 'Shl'],
+    ('3500', 'South'): ['Shl', 'Ut', 'Ehv', 'Vl'],
+    ('3900', 'North'): ['Hrl', 'Std', 'Ehv'],
+    ('3900', 'South'): ['Ehv', 'Std', 'Hrl'],
+}
+
+
+def _row_by_row_printout(solution_dict):
+    # The former generate_readable_timetable and print_timetable: parse the variable names,
+    # sort by the station order above and print row by row
+    rows = []
+    for var_name, time in solution_dict.items():
+        parts = var_name.split('_')
+        if parts[0] in {'dep', 'arr'}:
+            event_type = 'Departure' if parts[0] == 'dep' else 'Arrival'
+            direction = 'North' if 'return' in parts else 'South'
+            rows.append((parts[2], direction, parts[1], event_type, time))
+    df = pd.DataFrame(rows, columns=['Line', 'Direction', 'Station', 'Type', 'Time'])
+    df['StationOrder'] = [STATION_ORDER[(line, direction)].index(station)
+                          for line, direction, station in zip(df['Line'], df['Direction'], df['Station'])]
+    df = df.sort_values(by=['Line', 'Direction', 'StationOrder', 'Type']).reset_index(drop=True)
+
+    text = ''
+    for line in df['Line'].unique():
+        text += f"Line {line}:\n"
+        for direction in ['North', 'South']:
+            text += f"  Direction {direction}:\n"
+            for _, row in df[(df['Line'] == line) & (df['Direction'] == direction)].iterrows():
+                text += f"    {row['Type']} {row['Station']} at {int(row['Time'])} minutes\n"
+            text += "\n"
+    return text
+
+
+def test_ns_printout_unchanged():
+    ean = build_event_activity_network(load_network(os.path.join(HERE, 'a2_part1.xlsx'), use_cache=False))
+    event_times, _, _, _ = heuristic_timetable(ean, time_limit=0.5)
+    expected = _row_by_row_printout(solution_from_event_times(ean, event_times))
+    assert format_timetable(timetable_frame(ean, event_times)) == expected
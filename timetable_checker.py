@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+
+from event_activity import ACTIVITY_TYPE_NAMES, periodic_tensions
+
+
+def timetable_array(ean, solution_dict):
+    # Event times of a solution_dict (or any name -> time mapping) in event ID order
+    return np.array([solution_dict[name] for name in ean.event_names], dtype=np.int64)
+
+
+def check_timetables(ean, event_times):
+    # Checks one timetable (shape E) or a batch of timetables (shape B x E) against every
+    # activity and fixed event of the network in a single pass, without a solver.
+    # Returns a dict with per-timetable 'feasible' and 'objective', and per-activity 'spans'
+    # and 'excess' (minutes above the upper bound) plus per-fixed-event 'fixed_deviation'.
+    event_times = np.asarray(event_times, dtype=np.int64)
+    single = event_times.ndim == 1
+    times = np.atleast_2d(event_times)
+    T = ean.T
+
+    # The smallest periodic span is never below the lower bound, so only the upper bound can be violated
+    spans = periodic_tensions(ean, times)
+    excess = np.maximum(spans - ean.activity_upper, 0)
+
+    # Periodic distance between a fixed event and its required time
+    fixed = np.flatnonzero(ean.event_lower == ean.event_upper)
+    shift = np.mod(times[:, fixed] - ean.event_lower[fixed], T)
+    fixed_deviation = np.minimum(shift, T - shift)
+
+    feasible = ~np.any(excess > 0, axis=1) & ~np.any(fixed_deviation > 0, axis=1)
+    objective = spans @ ean.activity_weight + ean.objective_constant
+
+    result = {
+        'feasible': feasible,
+        'objective': objective,
+        'spans': spans,
+        'excess': excess,
+        'fixed_events': fixed,
+        'fixed_deviation': fixed_deviation,
+    }
+    if single:
+        result = {key: (value if key == 'fixed_events' else value[0]) for key, value in result.items()}
+    return result
+
+
+def violation_report(ean, event_times):
+    # Readable list of everything one timetable violates
+    check = check_timetables(ean, np.asarray(event_times))
+    rows = []
+    for a in np.flatnonzero(check['excess'] > 0):
+        rows.append((ean.activity_names[a], ACTIVITY_TYPE_NAMES[ean.activity_type[a]],
+                     ean.event_names[ean.activity_tail[a]], ean.event_names[ean.activity_head[a]],
+                     int(check['spans'][a]), int(ean.activity_lower[a]), int(ean.activity_upper[a])))
+    for k, e in enumerate(check['fixed_events']):
+        if check['fixed_deviation'][k] > 0:
+            rows.append((ean.event_names[e], 'fixed', ean.event_names[e], ean.event_names[e],
+                         int(np.mod(event_times[e], ean.T)), int(ean.event_lower[e]), int(ean.event_upper[e])))
+    return pd.DataFrame(rows, columns=['Name', 'Type', 'From', 'To', 'Value', 'Lower', 'Upper'])
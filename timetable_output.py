@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+
+from event_activity import FORWARD
+
+# Display names used by the readable timetable: the forward trip is southbound for the NS lines
+TYPE_LABELS = np.array(['Departure', 'Arrival'], dtype=object)
+DIRECTION_LABELS = np.array(['South', 'North'], dtype=object)
+COLUMNS = ['Line', 'Direction', 'Station', 'Type', 'Time']
+
+
+def timetable_order(ean):
+    # Event IDs in timetable order: line name, direction label, stop along the trip, arrival before departure
+    line_names = np.array(ean.line_names, dtype=object)
+    line_rank = np.argsort(np.argsort(line_names.astype(str)))[ean.event_line]
+    direction_rank = np.where(ean.event_direction == FORWARD, 1, 0)  # 'North' sorts before 'South'
+    type_rank = np.where(ean.event_type == 1, 0, 1)  # 'Arrival' sorts before 'Departure'
+    return np.lexsort((type_rank, ean.event_stop, direction_rank, line_rank))
+
+
+def timetable_frame(ean, event_times, order=None):
+    # Columnar timetable straight from the event arrays, no parsing of variable names
+    order = timetable_order(ean) if order is None else order
+    event_times = np.asarray(event_times)
+    return pd.DataFrame({
+        'Line': np.array(ean.line_names, dtype=object)[ean.event_line[order]],
+        'Direction': DIRECTION_LABELS[ean.event_direction[order]],
+        'Station': ean.stations[ean.event_station[order]],
+        'Type': TYPE_LABELS[ean.event_type[order]],
+        'Time': event_times[order],
+    })
+
+
+def format_timetable(timetable_df):
+    # Builds the whole printout with column-wise string operations
+    if timetable_df.empty:
+        return ''
+    line = timetable_df['Line'].astype(str)
+    direction = timetable_df['Direction'].astype(str)
+    new_line = (line != line.shift()).to_numpy()
+    new_direction = new_line | (direction != direction.shift()).to_numpy()
+    end_direction = np.roll(new_direction, -1)
+    end_direction[-1] = True
+
+    text = (
+        np.where(new_line, "Line " + line + ":\n", "")
+        + np.where(new_direction, "  Direction " + direction + ":\n", "")
+        + "    " + timetable_df['Type'].astype(str) + " " + timetable_df['Station'].astype(str)
+        + " at " + timetable_df['Time'].astype(int).astype(str) + " minutes\n"
+        + np.where(end_direction, "\n", "")
+    )
+    return ''.join(text)
+
+
+def write_timetable(ean, event_times, path, chunk_rows=100000):
+    # Streams the timetable to CSV or Parquet (by file extension) in chunks of chunk_rows events,
+    # so the full frame never has to exist at once for very large timetables
+    order = timetable_order(ean)
+    chunks = (order[k:k + chunk_rows] for k in range(0, len(order), chunk_rows))
+
+    if str(path).endswith('.parquet'):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Writing Parquet needs pyarrow (pip install pyarrow)") from None
+        writer = None
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(timetable_frame(ean, event_times, chunk), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(path, 'w', newline='') as f:
+            f.write(','.join(COLUMNS) + '\n')
+            for chunk in chunks:
+                timetable_frame(ean, event_times, chunk).to_csv(f, header=False, index=False)